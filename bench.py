@@ -0,0 +1,318 @@
+"""
+Benchmarks of the sieves module writing machine-readable JSON
+
+Run ``python bench.py --output bench.json`` for a report, then
+``python bench.py --compare bench.json`` on another version to see every timing relative to it.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import sieves
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# pi(10 ** k), to check every engine counts right before trusting its speed
+PI = {1: 4, 2: 25, 3: 168, 4: 1229, 5: 9592, 6: 78498, 7: 664579, 8: 5761455, 9: 50847534}
+# tracemalloc traces every allocation, which is too slow to bear past this
+TRACEMALLOC_LIMIT = 10 ** 7
+
+
+def _count(primes):
+    """
+    Return number of items of the given iterable consuming it without keeping them
+    """
+    last = deque(enumerate(primes, 1), maxlen=1)
+    return last[0][0] if last else 0
+
+
+def _count_chunks(chunks):
+    """
+    Return total length of chunks of the given iterable
+    """
+    return sum(map(len, chunks))
+
+
+# name: (function of n returning primes below n, counting function, largest n worth running)
+ENGINES = {
+    'sieve': (lambda n: sieves.take(lambda p: p < n, sieves.sieve(sieves.count(2, 1))), _count, 10 ** 9),
+    'incremental_sieve': (lambda n: sieves.take(lambda p: p < n, sieves.incremental_sieve(sieves.count(2, 1))),
+                          _count, 10 ** 7),
+    'segmented_sieve': (lambda n: sieves.segmented_sieve(hi=n), _count, 10 ** 9),
+    'array_sieve_chunks': (lambda n: sieves.array_sieve_chunks(n), _count_chunks, 10 ** 9),
+    'parallel_sieve_chunks': (lambda n: sieves.parallel_sieve_chunks(n), _count_chunks, 10 ** 9),
+}
+if sieves.np is None:
+    del ENGINES['array_sieve_chunks']
+
+
+def best_time(function, repeat=3):
+    """
+    Return the least number of seconds a call of the given function takes out of repeat calls
+
+    The least is the least noisy estimate, other processes may only slow a call down.
+    :param function: a function without arguments
+    :param repeat: number of calls
+    :return: a float
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def bench_primes(exponents, repeat=3, engines=ENGINES):
+    """
+    Return a list of results of generating all the primes below 10 ** k by every engine
+
+    :param exponents: an iterable of ints k
+    :param repeat: number of runs a timing is the best of
+    :param engines: a dict like ENGINES
+    :return: a list of dicts
+    """
+    results = []
+    for name, (function, counter, limit) in engines.items():
+        for k in exponents:
+            n = 10 ** k
+            if n > limit:
+                continue
+            count = counter(function(n))
+            seconds = best_time(lambda: counter(function(n)), repeat)
+            results.append({'benchmark': 'primes', 'engine': name, 'n': n, 'count': count,
+                            'correct': count == PI.get(k), 'seconds': seconds,
+                            'primes_per_second': count / seconds})
+    return results
+
+
+def bench_prime_file(exponents, repeat=3, directory=None):
+    """
+    Return a list of results of writing and reading back all the primes below 10 ** k with a prime file
+
+    :param exponents: an iterable of ints k
+    :param repeat: number of runs a timing is the best of
+    :param directory: a directory for the file, a temporary one if None
+    :return: a list of dicts
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        path = os.path.join(tmp, 'primes.gap')
+        for k in exponents:
+            n = 10 ** k
+            write = best_time(lambda: sieves.write_prime_file(path, sieves.segmented_sieve(hi=n)), repeat)
+            count = _count(sieves.read_prime_file(path))
+            read = best_time(lambda: _count(sieves.read_prime_file(path)), repeat)
+            results.append({'benchmark': 'prime_file', 'engine': 'read_prime_file', 'n': n, 'count': count,
+                            'correct': count == PI.get(k), 'seconds': read, 'primes_per_second': count / read,
+                            'write_seconds': write, 'bytes': os.path.getsize(path)})
+    return results
+
+
+# (function, counter) of the engine a memory benchmark process runs, set once by _init_memory_worker
+_engine = None
+# engines are mostly lambdas, which forked processes inherit rather than unpickle
+_MEMORY_CONTEXT = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+
+
+def _init_memory_worker(function, counter):
+    global _engine
+    _engine = function, counter
+
+
+def _peak_memory(n, trace):
+    """
+    Return (peak RSS in KiB above the RSS at start, peak RSS in KiB of the largest worker process it started or None,
+    peak of traced memory in bytes or None) of a run of the engine of the process
+    """
+    function, counter = _engine
+    start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0
+    if trace:
+        tracemalloc.start()
+    counter(function(n))
+    traced = None
+    if trace:
+        traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if resource is None:
+        return None, None, traced
+    # only worker processes which have exited and been waited for count, like those of a closed pool
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss or None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start, workers, traced
+
+
+def bench_memory(exponents, engines=ENGINES):
+    """
+    Return a list of results of peak memory of generating all the primes below 10 ** k by every engine
+
+    Every run takes place in a fresh process, so peaks of earlier runs don't hide later ones.
+    RSS is taken from a run of its own, since tracing allocations takes memory as well.
+    Worker processes of an engine are reported apart, by the peak RSS of the largest one,
+    tracemalloc only sees the process the engine is run in.
+    :param exponents: an iterable of ints k
+    :param engines: a dict like ENGINES
+    :return: a list of dicts
+    """
+    results = []
+    for name, (function, counter, limit) in engines.items():
+        for k in exponents:
+            n = 10 ** k
+            if n > limit:
+                continue
+            with ProcessPoolExecutor(1, _MEMORY_CONTEXT, _init_memory_worker, (function, counter)) as executor:
+                rss, workers, _ = executor.submit(_peak_memory, n, False).result()
+            traced = None
+            if n <= TRACEMALLOC_LIMIT:
+                with ProcessPoolExecutor(1, _MEMORY_CONTEXT, _init_memory_worker, (function, counter)) as executor:
+                    _, _, traced = executor.submit(_peak_memory, n, True).result()
+            results.append({'benchmark': 'memory', 'engine': name, 'n': n, 'peak_rss_kib': rss,
+                            'peak_worker_rss_kib': workers, 'tracemalloc_peak_bytes': traced})
+    return results
+
+
+def bench_nth_prime(exponents, repeat=3):
+    """
+    Return a list of results of latency of nth_prime(10 ** k), cold with an empty prime index and warm
+
+    :param exponents: an iterable of ints k
+    :param repeat: number of runs a timing is the best of
+    :return: a list of dicts
+    """
+    results = []
+
+    def cold(n):
+        sieves._prime_index = None
+        return sieves.nth_prime(n)
+
+    for k in exponents:
+        n = 10 ** k
+        results.append({'benchmark': 'nth_prime', 'engine': 'cold', 'n': n,
+                        'seconds': best_time(lambda: cold(n), repeat)})
+        results.append({'benchmark': 'nth_prime', 'engine': 'warm', 'n': n,
+                        'seconds': best_time(lambda: sieves.nth_prime(n), repeat)})
+    return results
+
+
+def bench_first_primes(exponents, repeat=3):
+    """
+    Return a list of results of latency of taking the first 10 ** k primes off sieve(count(2, 1))
+
+    :param exponents: an iterable of ints k
+    :param repeat: number of runs a timing is the best of
+    :return: a list of dicts
+    """
+    results = []
+    for k in exponents:
+        n = 10 ** k
+        seconds = best_time(lambda: _count(islice(sieves.sieve(sieves.count(2, 1)), n)), repeat)
+        results.append({'benchmark': 'first_primes', 'engine': 'sieve', 'n': n, 'seconds': seconds,
+                        'primes_per_second': n / seconds})
+    return results
+
+
+def bench_fib(exponents, repeat=3):
+    """
+    Return a list of results of throughput of the first 10 ** k items of fib() and latency of fib_nth(10 ** k)
+
+    :param exponents: an iterable of ints k
+    :param repeat: number of runs a timing is the best of
+    :return: a list of dicts
+    """
+    results = []
+    for k in exponents:
+        n = 10 ** k
+        seconds = best_time(lambda: _count(islice(sieves.fib(), n)), repeat)
+        results.append({'benchmark': 'fib', 'engine': 'fib', 'n': n, 'seconds': seconds,
+                        'numbers_per_second': n / seconds})
+        results.append({'benchmark': 'fib', 'engine': 'fib_nth', 'n': n,
+                        'seconds': best_time(lambda: sieves.fib_nth(n), repeat)})
+    return results
+
+
+def run(max_exponent=7, repeat=3, benchmarks=None):
+    """
+    Return a report of the given benchmarks with primes up to 10 ** max_exponent
+
+    :param max_exponent: an int, 9 for the whole range, which takes a while
+    :param repeat: number of runs a timing is the best of
+    :param benchmarks: an iterable of names of benchmarks, all of them if None
+    :return: a dict with environment under 'meta' and a list of dicts under 'results'
+    """
+    exponents = range(4, max_exponent + 1)
+    suites = {
+        'primes': lambda: bench_primes(exponents, repeat),
+        'prime_file': lambda: bench_prime_file(exponents, repeat),
+        'memory': lambda: bench_memory(exponents),
+        'nth_prime': lambda: bench_nth_prime(range(3, min(max_exponent, 8) + 1), repeat),
+        'first_primes': lambda: bench_first_primes(range(3, max_exponent), repeat),
+        'fib': lambda: bench_fib(range(3, min(max_exponent, 5) + 1), repeat),
+    }
+    results = []
+    for name in benchmarks or suites:
+        results += suites[name]()
+    meta = {
+        'python': sys.version,
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': sieves.np.__version__ if sieves.np is not None else None,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'max_exponent': max_exponent,
+        'repeat': repeat,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(report, baseline):
+    """
+    Return a list of (benchmark, engine, n, ratio) for results found in both reports, ratio of seconds to the baseline's
+
+    A ratio above 1 is a slowdown, below 1 a speedup.
+    :param report: a dict returned by run
+    :param baseline: a dict returned by run, like one loaded from an earlier JSON output
+    :return: a list of tuples
+
+    >>> old = {'results': [{'benchmark': 'fib', 'engine': 'fib', 'n': 1000, 'seconds': 2.0}]}
+    >>> new = {'results': [{'benchmark': 'fib', 'engine': 'fib', 'n': 1000, 'seconds': 3.0},
+    ...                    {'benchmark': 'fib', 'engine': 'fib_nth', 'n': 1000, 'seconds': 1.0}]}
+    >>> compare(new, old)
+    [('fib', 'fib', 1000, 1.5)]
+    """
+    key = lambda result: (result['benchmark'], result['engine'], result['n'])
+    seconds = {key(result): result['seconds'] for result in baseline['results'] if 'seconds' in result}
+    return [key(result) + (result['seconds'] / seconds[key(result)],)
+            for result in report['results'] if 'seconds' in result and seconds.get(key(result))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-exponent', type=int, default=7, help='benchmark primes up to 10 ** MAX_EXPONENT')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs a timing is the best of')
+    parser.add_argument('--only', action='append', help='run only the named benchmark, may be repeated')
+    parser.add_argument('--output', help='write JSON to the file instead of stdout')
+    parser.add_argument('--compare', help='print timings relative to an earlier JSON output to stderr')
+    args = parser.parse_args(argv)
+    report = run(args.max_exponent, args.repeat, args.only)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for benchmark, engine, n, ratio in compare(report, baseline):
+            print('{:<14} {:<22} {:>12} {:>8.3f}x'.format(benchmark, engine, n, ratio), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
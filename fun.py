@@ -1,7 +1,19 @@
 #!/usr/bin/env python3
 
+import builtins
+import itertools
+import linecache
 import sys
+import time
+from array import array
+from functools import lru_cache, partial, wraps
 from math import ceil, floor
+from numbers import Integral
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ### Misc functions you should find in a standard library of any decent functional PL
 
@@ -270,33 +282,61 @@ def tee(iterable, n=2):
 ### Selecting elements
 
 
-def map(function, iterable):
+def map(function, iterable, *iterables, chunk_size=None):
     """
     Return an iterator that applies function to every item of iterable, yielding the results.
     See https://docs.python.org/3/library/functions.html#map
 
+    Operators of this module applied to NumPy arrays are computed elementwise by NumPy at once.
     >>>
-    :param function: any function
+    :param function: any function, taking as many arguments as there are iterables
     :param iterable: an iterable object
+    :param iterables: more iterable objects, items are taken from all of them in parallel
+    :param chunk_size: if given, items are mapped in chunks of this size, see map_batches
     :return: a generator
     >>> list(map(lambda x: x.upper(), ['hello', 'there']))
     ['HELLO', 'THERE']
+
+    >>> list(map(batchwise(lambda chunk: [len(chunk)] * len(chunk)), range(5), chunk_size=2))
+    [2, 2, 2, 2, 1]
+
+    >>> list(map(ceildiv, [7, -7, 6], [2, 2, 3]))
+    [4, -3, 2]
     """
+    arrays = (iterable,) + iterables
+    numpy_operator = _numpy_operator(function, *arrays)
+    if numpy_operator is not None and numpy_operator[0] == len(arrays):
+        n = min(builtins.map(len, arrays))
+        yield from numpy_operator[1](*(a[:n] for a in arrays))
+        return
+    if iterables:
+        yield from map(lambda args: function(*args), builtins.zip(iterable, *iterables), chunk_size=chunk_size)
+        return
+    if chunk_size is not None:
+        yield from unbatched(map_batches(function, batched(iterable, chunk_size)))
+        return
     for i in iterable:
         yield function(i)
 
 
-def filter(predicate, iterable):
+def filter(predicate, iterable, chunk_size=None):
     """
     Construct an iterator from those elements of iterable for which function returns true.
     See https://docs.python.org/3/library/functions.html#filter
     :param predicate: a function with one argument returning bool
     :param iterable: any iterable object
+    :param chunk_size: if given, elements are filtered in chunks of this size, see filter_batches
     :return: an iterable
 
     >>> list(filter(lambda x: (x % 2) == 0, range(10)))
     [0, 2, 4, 6, 8]
+
+    >>> list(filter(lambda x: (x % 2) == 0, range(10), chunk_size=4))
+    [0, 2, 4, 6, 8]
     """
+    if chunk_size is not None:
+        yield from unbatched(filter_batches(predicate, batched(iterable, chunk_size)))
+        return
     for i in iterable:
         if predicate(i):
             yield i
@@ -304,13 +344,25 @@ def filter(predicate, iterable):
 def takewhile(predicate, iterable):
     """
     Make an iterator that returns elements from the iterable as long as the predicate is true.
+
+    A predicate with a pushdown method, like sieves.below(), is handed the iterable first,
+    if it returns a bounded equivalent of it, that is taken from instead.
     :param predicate: a function returning bool
     :param iterable: any iterable
     :return: an iterable with elements satisfying predicate
 
     >>> list(takewhile(lambda x: x < 5, range(100)))
     [0, 1, 2, 3, 4]
+
+    >>> import sieves
+    >>> list(takewhile(sieves.below(20), sieves.sieve(sieves.count())))
+    [2, 3, 5, 7, 11, 13, 17, 19]
     """
+    pushdown = getattr(predicate, 'pushdown', None)
+    bounded = pushdown(iterable) if pushdown is not None else None
+    if bounded is not None:
+        yield from bounded
+        return
     for i in iterable:
         if predicate(i):
             yield i
@@ -355,11 +407,12 @@ def filterfalse(predicate, iterable):
             yield i
 
 
-def compress(data, selectors):
+def compress(data, selectors, chunk_size=None):
     """
     returns only those elements of data for which the corresponding element of selectors is true
     :param data: iterable of elements to select from
     :param selectors: boolean selectors used to select elements of data iterable
+    :param chunk_size: if given, elements are selected in chunks of this size, see compress_batches
     :return: an iterable of selected elements
 
     >>> list(compress([1,2,3,4,5], [True, True, False, False, True]))
@@ -367,7 +420,13 @@ def compress(data, selectors):
 
     >>> list(compress([1,2,3,4,5], [lambda x: x > 0, lambda x: x == 1, False, True, lambda x: x % 2 != 0]))
     [1, 2, 4, 5]
+
+    >>> list(compress(range(10), [1, 0, 0, 1, 1, 0, 1], chunk_size=3))
+    [0, 3, 4, 6]
     """
+    if chunk_size is not None:
+        yield from unbatched(compress_batches(batched(data, chunk_size), selectors))
+        return
     datai = iter(data)
     selectorsi = iter(selectors)
 
@@ -513,16 +572,18 @@ def groupby(iterable, keyfun=None):
 ### functools module
 
 def reduce(function, base, iterable):
-    # See foldl function in this file
-    return foldl(function, base, iterable)
+    # See foldl function in this file, operators of this module fold NumPy arrays with ufuncs
+    result = _numpy_fold(function, base, iterable, False)
+    return foldl(function, base, iterable) if result is None else result
 
-def accumulate(function, base, iterable):
+def accumulate(function, base, iterable, chunk_size=None):
     """
     Return an iterable of partial results of recursively applying a function to the given iterable.
 
     :param function: function taking base and an element of iterable as arguments
     :param base: base value taken by the function
     :param iterable: any iterable object
+    :param chunk_size: if given, elements are accumulated in chunks of this size, see accumulate_batches
     :return: an iterable of partial results
 
     >>> list(accumulate(lambda a, b: a + b, 0, range(10)))
@@ -534,21 +595,660 @@ def accumulate(function, base, iterable):
     # factorial function
     >>> list(accumulate(lambda a, b: a * b, 1, range(1, 6)))[-1]
     120
+
+    >>> list(accumulate(lambda a, b: a * b, 1, range(1, 6), chunk_size=2))
+    [1, 2, 6, 24, 120]
+
+    # operators of this module accumulate NumPy arrays with ufuncs, dividing ints exactly
+    >>> import numpy
+    >>> [int(x) for x in accumulate(ceildiv, 10 ** 18 + 1, numpy.array([3, -7, 2]))]
+    [333333333333333334, -47619047619047619, -23809523809523809]
+    >>> int(reduce(add, 0, numpy.arange(10)))
+    45
+    >>> floats = numpy.random.default_rng(0).random(10 ** 5)
+    >>> bool(reduce(add, 0.0, floats) == foldl(add, 0.0, floats) == list(accumulate(add, 0.0, floats))[-1])
+    True
     """
+    result = _numpy_fold(function, base, iterable, True)
+    if result is not None:
+        yield from result
+        return
+    if chunk_size is not None:
+        yield from unbatched(accumulate_batches(function, base, batched(iterable, chunk_size)))
+        return
 
     for i in iterable:
         base = function(base, i)
         yield base
 
+### Streams
+
+# kinds of stages of a plan, a stage is a tuple of its kind followed by its arguments
+MAP, FILTER, FILTERFALSE, TAKEWHILE, DROPWHILE, TAKE = 'map', 'filter', 'filterfalse', 'takewhile', 'dropwhile', 'take'
+COMPRESS, ACCUMULATE = 'compress', 'accumulate'
+# number of arguments of a stage by its kind
+_STAGE_ARITY = {MAP: 1, FILTER: 1, FILTERFALSE: 1, TAKEWHILE: 1, DROPWHILE: 1, TAKE: 1, COMPRESS: 1, ACCUMULATE: 2}
+
+
+class Stream:
+    """
+    A lazy chain of map, filter, filterfalse, takewhile, dropwhile, compress, accumulate and take stages over an iterable.
+
+    Stages only extend a plan, nothing is evaluated until the stream is iterated over, reduced
+    or turned into a list, then the whole plan is run at once by native iterators rather than
+    passing every element through a Python generator per stage.
+
+    >>> Stream(range(20)).map(lambda x: x * x).filter(lambda x: x % 2).take(4).list()
+    [1, 9, 25, 49]
+
+    >>> Stream(range(10)).dropwhile(lambda x: x < 3).takewhile(lambda x: x < 7).reduce(add, 0)
+    18
+    """
+
+    def __init__(self, iterable, plan=(), estimates=None):
+        """
+        :param iterable: any iterable object
+        :param plan: a tuple of (kind, *arguments) stages applied in order
+        :param estimates: a tuple of (selectivity, seconds per call) of filters or None by stage, see optimize
+        """
+        self.iterable = iterable
+        self.plan = plan
+        self.estimates = estimates
+
+    def __repr__(self):
+        return 'Stream({!r}){}'.format(self.iterable, ''.join(
+            '.{}({})'.format(kind, ', '.join(repr(arg) for arg in args)) for kind, *args in self.plan))
+
+    def _then(self, *stage):
+        return Stream(self.iterable, self.plan + (stage,), self.estimates and self.estimates + (None,))
+
+    def map(self, function):
+        """
+        Return a stream with function applied to every element, see map
+        """
+        return self._then(MAP, function)
+
+    def filter(self, predicate):
+        """
+        Return a stream of elements for which predicate returns true, see filter
+        """
+        return self._then(FILTER, predicate)
+
+    def filterfalse(self, predicate):
+        """
+        Return a stream of elements for which predicate returns false, see filterfalse
+        """
+        return self._then(FILTERFALSE, predicate)
+
+    def takewhile(self, predicate):
+        """
+        Return a stream of elements as long as predicate is true, see takewhile
+        """
+        return self._then(TAKEWHILE, predicate)
+
+    def dropwhile(self, predicate):
+        """
+        Return a stream of elements starting from the first one predicate is false for, see dropwhile
+        """
+        return self._then(DROPWHILE, predicate)
+
+    def take(self, n):
+        """
+        Return a stream of the first n elements, see firstn
+        """
+        return self._then(TAKE, n)
+
+    def compress(self, selectors):
+        """
+        Return a stream of elements whose corresponding selectors are true, see compress
+        """
+        return self._then(COMPRESS, selectors)
+
+    def accumulate(self, function, base):
+        """
+        Return a stream of partial results of applying function to elements starting from base, see accumulate
+        """
+        return self._then(ACCUMULATE, function, base)
+
+    def _source(self):
+        """
+        Return (iterable, plan) with a bound on the first stage pushed down to the iterable if possible, see takewhile
+        """
+        iterable, plan = self.iterable, self.plan
+        if plan and plan[0][0] == TAKEWHILE and hasattr(plan[0][1], 'pushdown'):
+            bounded = plan[0][1].pushdown(iterable)
+            if bounded is not None:
+                iterable, plan = bounded, plan[1:]
+        return iterable, plan
+
+    def __iter__(self):
+        return _fused(*self._source())
+
+    def optimize(self, sample_size=1000):
+        """
+        Return an equivalent stream with filters reordered to make the fewest expensive predicate calls
+
+        Selectivity and cost of filters are measured on the first sample_size elements,
+        which are put back in front of the rest, see optimize_filters. Only stages with callables
+        marked pure by a true pure attribute are run on the sample, planning stops at the first other one.
+        :param sample_size: number of elements to measure predicates on
+        :return: a Stream
+        """
+        iterable, plan = self._source()
+        it = iter(iterable)
+        sample = list(itertools.islice(it, sample_size))
+        plan, estimates = optimize_filters(plan, sample)
+        return Stream(itertools.chain(sample, it), plan, estimates)
+
+    def explain(self):
+        """
+        Print stages of the stream with selectivity and cost of filters measured by optimize,
+        and estimated cost per element of every group of filters that may be reordered,
+        taking predicates as independent.
+        """
+        estimates = self.estimates or (None,) * len(self.plan)
+        group = []
+        for i, ((kind, *args), estimate) in enumerate(builtins.zip(self.plan, estimates)):
+            names = ', '.join(getattr(arg, '__name__', None) or repr(arg) for arg in args)
+            if estimate is None:
+                print('{} {} {}'.format(i, kind, names))
+            else:
+                print('{} {} {}: selectivity {:.2f}, {:.0f} ns per call'.format(i, kind, names, estimate[0],
+                                                                               estimate[1] * 1e9))
+                group.append(estimate)
+            if group and (estimate is None or i == len(self.plan) - 1):
+                last = i if estimate is not None else i - 1
+                print('filters {}-{}: {:.0f} ns per element if independent'.format(
+                    last - len(group) + 1, last, _filters_cost(group) * 1e9))
+                group = []
+
+    def list(self):
+        """
+        Return a list of elements of the stream
+        """
+        return list(self)
+
+    def reduce(self, function, base):
+        """
+        Return the result of folding elements of the stream with function starting from base, see foldl
+        """
+        return foldl(function, base, self)
+
+    def compile(self):
+        """
+        Return a function of an iterable running the plan of the stream on it as one loop, see compile_pipeline
+        """
+        return compile_pipeline(self.plan)
+
+    def source(self):
+        """
+        Return the source of the function compile() generates for the stream, see pipeline_source
+        """
+        return pipeline_source(self.plan)
+
+
+def _fused(iterable, plan):
+    """
+    Return an iterator of elements of the iterable passed through all the stages of the plan.
+
+    Stages are run by iterators of builtins and itertools, which are implemented in C,
+    so an element passes through all of them without resuming a Python frame per stage.
+    """
+    it = iter(iterable)
+    for kind, arg, *rest in plan:
+        if kind == MAP:
+            it = builtins.map(arg, it)
+        elif kind == FILTER:
+            it = builtins.filter(arg, it)
+        elif kind == FILTERFALSE:
+            it = itertools.filterfalse(arg, it)
+        elif kind == TAKEWHILE:
+            it = itertools.takewhile(arg, it)
+        elif kind == DROPWHILE:
+            it = itertools.dropwhile(arg, it)
+        elif kind == COMPRESS:
+            it = itertools.compress(it, arg)
+        elif kind == ACCUMULATE:
+            # unlike fun.accumulate itertools.accumulate yields the base itself first
+            it = itertools.islice(itertools.accumulate(it, arg, initial=rest[0]), 1, None)
+        else:
+            it = itertools.islice(it, max(arg, 0))
+    return it
+
+
+def optimize_filters(plan, sample):
+    """
+    Return (plan, estimates) with runs of consecutive filter and filterfalse stages reordered by measured cost.
+
+    The plan is run on the sample up to the first stage which isn't safe to run twice on the same elements,
+    as the sample is run through the whole plan again afterwards: a stage is only run if its callable has
+    a true pure attribute, take stages always are, compress stages if their selectors aren't a one-shot
+    iterator. Every predicate of a run of filters is called once on the sample elements that reach the run,
+    to measure its selectivity, the share of elements it passes, and its cost per call. Filters of a run
+    are sorted by cost / (1 - selectivity), which minimizes the expected cost per element of independent
+    predicates: cheap ones dropping many elements go first.
+    :param plan: an iterable of (kind, *arguments) stages, see compile_pipeline
+    :param sample: an iterable of elements the plan is run on
+    :return: a tuple of a new plan and a tuple of (selectivity, seconds per call) of filters or None by stage
+
+    >>> def slow(x):
+    ...     return sum(range(1000)) and x % 3
+    >>> def tenth(x):
+    ...     return x % 10 == 0
+    >>> slow.pure = tenth.pure = True
+    >>> plan, estimates = optimize_filters([(FILTER, slow), (FILTER, tenth), (MAP, str)], range(1000))
+    >>> [(kind, f.__name__) for kind, f in plan]
+    [('filter', 'tenth'), ('filter', 'slow'), ('map', 'str')]
+    >>> [estimate and round(estimate[0], 2) for estimate in estimates]
+    [0.1, 0.67, None]
+    """
+    plan, current = tuple(plan), list(sample)
+    result, estimates = [], []
+    i = 0
+    while i < len(plan) and _replayable(plan[i]):
+        j = i
+        while j < len(plan) and plan[j][0] in (FILTER, FILTERFALSE) and _replayable(plan[j]):
+            j += 1
+        if j == i:
+            current = list(_fused(current, plan[i:i + 1]))
+            result.append(plan[i])
+            estimates.append(None)
+            i += 1
+            continue
+        measured, passing = [], [True] * len(current)
+        for stage in plan[i:j]:
+            passed, seconds = _measure_filter(stage, current)
+            measured.append((stage, sum(passed) / len(current) if current else 1.0,
+                             seconds / max(len(current), 1)))
+            passing = [p and q for p, q in builtins.zip(passing, passed)]
+        measured.sort(key=lambda m: m[2] / (1 - m[1]) if m[1] < 1 else float('inf'))
+        # every filter of the run is measured on the same elements, so its selectivity isn't
+        # conditional on the filters put before it, the order is only optimal for independent predicates
+        for stage, selectivity, cost in measured:
+            result.append(stage)
+            estimates.append((selectivity, cost))
+        current = list(itertools.compress(current, passing))
+        i = j
+    estimates += [None] * (len(plan) - i)
+    return tuple(result) + plan[i:], tuple(estimates)
+
+
+def _replayable(stage):
+    """
+    Return whether a stage may be run on sample elements which are run through it again, see optimize_filters.
+    """
+    kind, arg = stage[:2]
+    if kind == TAKE:
+        return True
+    if kind == COMPRESS:
+        return iter(arg) is not arg
+    return bool(getattr(arg, 'pure', False))
+
+
+def _measure_filter(stage, elements):
+    """
+    Return (a list of bools whether every element is passed, seconds taken) by a filter or filterfalse stage.
+    """
+    kind, predicate = stage
+    start = time.perf_counter()
+    results = [predicate(x) for x in elements]
+    seconds = time.perf_counter() - start
+    return [bool(r) == (kind == FILTER) for r in results], seconds
+
+
+def _filters_cost(estimates):
+    """
+    Return expected seconds per element of filters with the given (selectivity, seconds per call) run in order.
+    """
+    cost, reach = 0.0, 1.0
+    for selectivity, seconds in estimates:
+        cost += reach * seconds
+        reach *= selectivity
+    return cost
+
+
+def compile_pipeline(plan):
+    """
+    Return a function of an iterable returning a generator of its elements passed through the stages of the plan.
+
+    Rather than stacking a generator per stage, a single generator function with one flat loop
+    is generated for the kinds of stages of the plan, with callables of the stages passed to it
+    as arguments, so they are looked up as locals. Generated functions are cached by the kinds
+    of stages, so plans of the same shape with different callables share one.
+    :param plan: an iterable of (kind, *arguments) stages like (MAP, function), (ACCUMULATE, function, base)
+                 or (TAKE, n), see Stream for their meaning
+    :return: a function of an iterable
+
+    >>> odd_doubled = compile_pipeline([(FILTER, lambda x: x % 2), (MAP, lambda x: 2 * x), (TAKE, 3)])
+    >>> list(odd_doubled(range(100)))
+    [2, 6, 10]
+
+    >>> list(compile_pipeline([(ACCUMULATE, add, 0), (COMPRESS, [1, 0, 1, 1])])(range(1, 10)))
+    [1, 6, 10]
+    """
+    plan = tuple(tuple(stage) for stage in plan)
+    for kind, *args in plan:
+        if _STAGE_ARITY.get(kind) != len(args):
+            raise ValueError('invalid stage {!r}'.format((kind, *args)))
+    function, _ = _pipeline_code(tuple(kind for kind, *args in plan))
+    return partial(function, *(arg for kind, *args in plan for arg in args))
+
+
+def pipeline_source(plan):
+    """
+    Return the source of the function compile_pipeline generates for the given plan.
+
+    :param plan: an iterable of (kind, *arguments) stages, only their kinds matter
+    :return: a str
+
+    >>> print(pipeline_source([(MAP, abs), (FILTER, bool), (TAKE, 5)]))
+    def pipeline(s0, s1, s2, iterable):
+        left2 = s2
+        if left2 <= 0:
+            return
+        for x in iterable:
+            x = s0(x)
+            if s1(x):
+                left2 -= 1
+                yield x
+            if not left2:
+                return
+    """
+    kinds = tuple(stage[0] for stage in plan)
+    if not set(kinds) <= set(_STAGE_ARITY):
+        raise ValueError('invalid stages {!r}'.format(kinds))
+    return _pipeline_code(kinds)[1]
+
+
+@lru_cache(maxsize=None)
+def _pipeline_code(kinds):
+    """
+    Return (function, source) of a generator function running stages of the given kinds in one loop.
+    """
+    params, setup, body, checks = [], [], [], []
+    # indentation of the body of the loop, every filtering stage nests the rest of the stages
+    indent = '        '
+    for i, kind in enumerate(kinds):
+        s = 's{}'.format(i)
+        params.append(s)
+        if kind == MAP:
+            body.append(indent + 'x = {}(x)'.format(s))
+        elif kind == FILTER:
+            body.append(indent + 'if {}(x):'.format(s))
+            indent += '    '
+        elif kind == FILTERFALSE:
+            body.append(indent + 'if not {}(x):'.format(s))
+            indent += '    '
+        elif kind == TAKEWHILE:
+            body += [indent + 'if not {}(x):'.format(s), indent + '    return']
+        elif kind == DROPWHILE:
+            setup.append('dropping{} = True'.format(i))
+            body += [indent + 'if not (dropping{} and {}(x)):'.format(i, s), indent + '    dropping{} = False'.format(i)]
+            indent += '    '
+        elif kind == COMPRESS:
+            setup.append('next{} = iter({}).__next__'.format(i, s))
+            body += [indent + 'try:', indent + '    selected{} = next{}()'.format(i, i),
+                     indent + 'except StopIteration:', indent + '    return', indent + 'if selected{}:'.format(i)]
+            indent += '    '
+        elif kind == ACCUMULATE:
+            params.append('acc{}'.format(i))
+            body += [indent + 'acc{0} = {1}(acc{0}, x)'.format(i, s), indent + 'x = acc{}'.format(i)]
+        elif kind == TAKE:
+            setup += ['left{} = {}'.format(i, s), 'if left{} <= 0:'.format(i), '    return']
+            body.append(indent + 'left{} -= 1'.format(i))
+            # an element taken last still goes through the rest of the stages before the loop ends
+            checks += ['if not left{}:'.format(i), '    return']
+        else:
+            raise ValueError('unknown stage {!r}'.format(kind))
+    body.append(indent + 'yield x')
+    source = '\n'.join(['def pipeline({}):'.format(', '.join(params + ['iterable']))] +
+                       ['    ' + line for line in setup] +
+                       ['    for x in iterable:'] + body +
+                       ['        ' + line for line in checks])
+    filename = '<pipeline {}>'.format(' '.join(kinds))
+    namespace = {}
+    exec(compile(source, filename, 'exec'), namespace)
+    # lets tracebacks and inspect show lines of the generated source
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    return namespace['pipeline'], source
+
+
+### Batches
+
+# default number of elements per chunk of batches
+CHUNK_SIZE = 1024
+
+
+def batchwise(function):
+    """
+    Return a wrapper of the given function marked as taking a whole chunk of elements rather than one of them.
+
+    Batch functions of map_batches take a chunk and return a chunk of results, of filter_batches
+    take a chunk and return its mask of bools, of accumulate_batches take the base and a chunk
+    and return a chunk of partial results. Functions not marked are called per element.
+    :param function: a function taking chunks, like a NumPy ufunc
+    :return: a function with a true batchwise attribute, the given one is left unmarked
+
+    >>> reverse = lambda chunk: chunk[::-1]
+    >>> list(unbatched(map_batches(batchwise(reverse), [[3, 1, 2], [5, 4]])))
+    [2, 1, 3, 4, 5]
+    >>> hasattr(reverse, 'batchwise')
+    False
+    """
+    @wraps(function)
+    def wrapper(*args):
+        return function(*args)
+
+    wrapper.batchwise = True
+    return wrapper
+
+
+def batched(iterable, size=CHUNK_SIZE):
+    """
+    Return a generator of consecutive chunks of at most size elements of the iterable.
+
+    NumPy arrays and array.array are sliced into chunks of their own type, other iterables into lists.
+    :param iterable: any iterable object
+    :param size: number of elements per chunk
+    :return: a generator of chunks
+
+    >>> list(batched(range(7), 3))
+    [[0, 1, 2], [3, 4, 5], [6]]
+
+    >>> list(batched(array('i', range(5)), 2))
+    [array('i', [0, 1]), array('i', [2, 3]), array('i', [4])]
+    """
+    if isinstance(iterable, array) or hasattr(iterable, 'dtype'):
+        for i in range(0, len(iterable), size):
+            yield iterable[i:i + size]
+        return
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def unbatched(chunks):
+    """
+    Return an iterator of elements of the given chunks one by one, NumPy scalars turned into Python numbers.
+
+    :param chunks: an iterable of chunks
+    :return: an iterator
+
+    >>> list(unbatched([[1, 2], array('i', [3])]))
+    [1, 2, 3]
+    """
+    return itertools.chain.from_iterable(builtins.map(_elements, chunks))
+
+
+def _elements(chunk):
+    """
+    Return the chunk itself or a list of its elements if it's an array.
+    """
+    return chunk.tolist() if hasattr(chunk, 'tolist') else chunk
+
+
+def _select(chunk, mask):
+    """
+    Return the chunk's elements whose corresponding elements of the mask are true, in a chunk of the same type.
+    """
+    if hasattr(chunk, 'dtype'):
+        return chunk.compress(mask)
+    if isinstance(chunk, array):
+        return array(chunk.typecode, itertools.compress(chunk, mask))
+    return list(itertools.compress(chunk, mask))
+
+
+def map_batches(function, chunks):
+    """
+    Return a generator of chunks of results of function applied to the given chunks, see batchwise.
+
+    :param function: a batch function, or any function called per element
+    :param chunks: an iterable of chunks
+    :return: a generator of chunks
+    """
+    if getattr(function, 'batchwise', False):
+        yield from builtins.map(function, chunks)
+        return
+    for chunk in chunks:
+        yield list(builtins.map(function, chunk))
+
+
+def filter_batches(predicate, chunks):
+    """
+    Return a generator of non-empty chunks of elements of the given chunks for which predicate is true, see batchwise.
+
+    :param predicate: a batch function returning masks, or any function called per element
+    :param chunks: an iterable of chunks
+    :return: a generator of chunks
+    """
+    batch = getattr(predicate, 'batchwise', False)
+    for chunk in chunks:
+        if batch:
+            chunk = _select(chunk, predicate(chunk))
+        elif isinstance(chunk, list):
+            chunk = list(builtins.filter(predicate, chunk))
+        else:
+            chunk = _select(chunk, list(builtins.map(predicate, chunk)))
+        if len(chunk):
+            yield chunk
+
+
+def compress_batches(chunks, selectors):
+    """
+    Return a generator of non-empty chunks of elements of the given chunks whose corresponding selectors are true.
+
+    :param chunks: an iterable of chunks
+    :param selectors: an iterable of selectors, elements past the last selector are dropped
+    :return: a generator of chunks
+    """
+    selectors = iter(selectors)
+    for chunk in chunks:
+        mask = list(itertools.islice(selectors, len(chunk)))
+        selected = _select(chunk[:len(mask)], mask)
+        if len(selected):
+            yield selected
+        if len(mask) < len(chunk):
+            return
+
+
+def accumulate_batches(function, base, chunks):
+    """
+    Return a generator of chunks of partial results of applying function to elements of chunks starting from base.
+
+    :param function: a batch function taking base and a chunk, see batchwise, or any function called per element
+    :param base: base value taken by the function
+    :param chunks: an iterable of chunks
+    :return: a generator of chunks
+    """
+    batch = getattr(function, 'batchwise', False)
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        if batch:
+            chunk = function(base, chunk)
+        else:
+            chunk = list(itertools.accumulate(chunk, function, initial=base))[1:]
+        base = chunk[-1]
+        yield chunk
+
+
 ### operator module
 
 # maths
 add = lambda a, b: a + b
 sub = lambda a, b: a - b
 mul = lambda a, b: a * b
-floordiv = lambda a, b: floor(a / b)
-ceildiv = lambda a, b: ceil(a / b)
-abs = lambda a: abs(a)
+# ints are divided exactly, float division loses precision past 2 ** 53
+floordiv = lambda a, b: a // b if isinstance(a, Integral) and isinstance(b, Integral) else floor(a / b)
+ceildiv = lambda a, b: a // b + (a % b != 0) if isinstance(a, Integral) and isinstance(b, Integral) else ceil(a / b)
+abs = lambda a: builtins.abs(a)
+
+
+def _ceil_divide(a, b):
+    """
+    Return ceilings of a / b of integer NumPy arrays elementwise.
+    """
+    q, r = np.divmod(a, b)
+    return q + (r != 0)
+
+
+# NumPy counterparts of the operators: (operator, number of arguments, elementwise function,
+# ufunc folds are made with, dtype kinds results are the same for as with the operator itself);
+# floor_divide of floats differs from floor(a / b), ceildiv is folded by floor_divide with the base
+# negated, as ceil(x / b) == -floor(-x / b), which doesn't work for unsigned ints
+_NUMPY_OPERATORS = [] if np is None else [
+    (add, 2, np.add, np.add, 'iuf'),
+    (sub, 2, np.subtract, np.subtract, 'iuf'),
+    (mul, 2, np.multiply, np.multiply, 'iuf'),
+    (floordiv, 2, np.floor_divide, np.floor_divide, 'iu'),
+    (ceildiv, 2, _ceil_divide, np.floor_divide, 'i'),
+    (abs, 1, np.absolute, None, 'iuf'),
+]
+
+
+def _numpy_operator(function, *arrays):
+    """
+    Return (number of arguments, elementwise function, ufunc or None, dtype kinds) of the NumPy counterpart
+    of one of the operators if the arrays are one-dimensional NumPy arrays of dtypes it suits, None otherwise.
+    """
+    for operator, *numpy_operator in _NUMPY_OPERATORS:
+        if operator is function:
+            if builtins.all(isinstance(a, np.ndarray) and a.ndim == 1 and a.dtype.kind in numpy_operator[-1]
+                            for a in arrays):
+                return tuple(numpy_operator)
+            return None
+    return None
+
+
+def _numpy_fold(function, base, array, accumulate):
+    """
+    Return reduce(function, base, array), or an array of accumulate(...) if accumulate, folded by a ufunc,
+    None if function is not an operator with one or the result would differ from folding it in Python.
+    """
+    numpy_operator = _numpy_operator(function, array)
+    if numpy_operator is None or numpy_operator[2] is None or not len(array):
+        return None
+    _, _, ufunc, kinds = numpy_operator
+    negate = function is ceildiv
+    try:
+        dtype = np.result_type(base, array)
+        head = np.array([-base if negate else base], dtype=dtype)
+    except (TypeError, OverflowError):
+        return None
+    if dtype.kind not in kinds:
+        return None
+    values = np.concatenate((head, array))
+    # unlike Python folds reductions of small ints would be upcast if not given the dtype
+    if accumulate or dtype.kind == 'f':
+        # reductions of floats add pairwise, which rounds differently, accumulations go in order
+        result = ufunc.accumulate(values, dtype=dtype)
+        result = result[1:] if accumulate else result[-1]
+    else:
+        result = ufunc.reduce(values, dtype=dtype)
+    return -result if negate else result
 
 """
 >>> reduce(add, 0, range(10))
@@ -1,5 +1,44 @@
 #!/usr/bin/env python3
 
+import asyncio
+import inspect
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from fractions import Fraction
+from functools import lru_cache
+from itertools import accumulate, compress, islice
+from math import comb, gcd, isqrt, log, prod
+from operator import sub
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Number of odd numbers (one byte each) sieved at a time, sized to fit the L1/L2 data cache
+SEGMENT_SIZE = 1 << 15
+# Number of primes per block of a prime file, the unit of seeking in it
+PRIME_FILE_BLOCK = 1 << 12
+# Number of factorizations kept by factorize's LRU cache
+FACTOR_CACHE_SIZE = 1 << 16
+# Largest prime index limit lehmer_prime_count looks pi(x) up in, about 6 MiB of bitmap
+PI_TABLE_LIMIT = 10 ** 8
+# Number of phi(x, a) sub-results kept by lehmer_prime_count's LRU cache
+PHI_CACHE_SIZE = 1 << 20
+
 def count(start=2, step=1):
     """
     Return an infinite generator of ints starting from the given value changing with a given step
@@ -27,23 +66,165 @@ def count(start=2, step=1):
         else:
             start += step
 
+def wheel(start=2, modulus=30):
+    """
+    Return an infinite generator of ints starting from the given value with multiples of the wheel primes left out
+
+    Wheel primes are the primes dividing the modulus, they are generated themselves before
+    the ints coprime to the modulus, so that the stream can replace count() as a sieve's input:
+    a mod 30 wheel drops ~73% of ints, a mod 210 wheel drops ~77% of them.
+    :param start: an int the generator starts from
+    :param modulus: an int the wheel turns around, usually a primorial like 30 or 210
+    :return: an infinite generator
+
+    >>> list(take(lambda x: x < 50, wheel()))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 49]
+
+    >>> W = wheel(modulus=210)
+    >>> next(W), next(W), next(W), next(W), next(W)
+    (2, 3, 5, 7, 11)
+    >>> W.send(100)
+    101
+    >>> next(W)
+    103
+    """
+    primes = _wheel_primes(modulus)
+    residues = [r for r in range(modulus) if gcd(r, modulus) == 1]
+    val = start
+    while True:
+        # ints below 2 are never generated, so that 1 isn't mistaken for a residue
+        n = max(val, 2)
+        for p in primes:
+            if p >= n:
+                val = (yield p)
+                # if .send() method invoked
+                if val is not None:
+                    break
+        else:
+            base = n - n % modulus
+            i = bisect_left(residues, n % modulus)
+            while True:
+                if i == len(residues):
+                    base, i = base + modulus, 0
+                val = (yield base + residues[i])
+                if val is not None:
+                    break
+                i += 1
+
+
 def take(pred, gen):
     """
     Return a generator with elements not satisfying predicate filtered out
 
+    A predicate with a pushdown method, like below(), is handed the generator first,
+    if it returns a bounded equivalent of it, like a sieve up to the bound, that is taken from instead.
     :param pred: a predicate function
     :param iter: a generator
     :return: a generator with predicate applied to the given generator
 
     >>> list(take(lambda x: x < 10, (i for i in range(100))))[-1]
     9
+
+    >>> list(take(below(30), sieve(count())))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
     """
+    pushdown = getattr(pred, 'pushdown', None)
+    bounded = pushdown(gen) if pushdown is not None else None
+    if bounded is not None:
+        yield from bounded
+        return
     for i in gen:
         if pred(i):
             yield i
         else:
             break
 
+class Below:
+    """
+    Predicate x < limit whose limit generators it's applied to can be bounded by
+
+    Calling it is the same as calling lambda x: x < limit, but take() and fun.takewhile()
+    hand generators to its pushdown method first, so that an infinite sieve gets replaced
+    by a sieve up to the limit rather than being run until a prime past the limit turns up.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def __call__(self, x):
+        return x < self.limit
+
+    def __repr__(self):
+        return 'below({!r})'.format(self.limit)
+
+    def pushdown(self, gen):
+        """
+        Return an iterable of the elements of the given generator less than the limit, None if gen is not recognized
+
+        Fresh generators of sieve(), segmented_sieve(), prime_stream() and count() with a positive step
+        are recognized, all of them are ascending, so that their elements below the limit are
+        the ones taken before the first element failing the predicate.
+        :param gen: a generator
+        :return: an iterable or None
+        """
+        return _bounded(gen, self.limit)
+
+
+def below(limit):
+    """
+    Return a predicate x < limit recognized by take() and fun.takewhile() to bound generators with
+
+    :param limit: an int elements are less than
+    :return: a Below instance
+
+    >>> list(take(below(10), count(step=3)))
+    [2, 5, 8]
+
+    >>> list(take(below(10 ** 7), sieve(count(start=2, step=1))))[-1]
+    9999991
+    """
+    return Below(limit)
+
+
+def _bounded(gen, hi):
+    """
+    Return an iterable of the elements of the given fresh generator less than hi, None if the generator is not recognized
+    """
+    args = _created_by(gen, sieve)
+    if args is not None:
+        ints = args['ints']
+        count_args = _created_by(ints, count)
+        wheel_args = _created_by(ints, wheel)
+        if count_args is not None and (count_args['start'], count_args['step']) == (2, 1):
+            return _bounded_primes(2, hi)
+        if wheel_args is not None and wheel_args['start'] <= 2:
+            return _bounded_primes(2, hi)
+        # primes sieved out of ints are among them, so ints may be bounded instead
+        ints = _bounded(ints, hi)
+        return incremental_sieve(ints) if ints is not None else None
+    args = _created_by(gen, segmented_sieve)
+    if args is not None:
+        return _bounded_primes(args['lo'], hi if args['hi'] is None else min(args['hi'], hi))
+    args = _created_by(gen, prime_stream)
+    if args is not None:
+        return _bounded_primes(args['start'], hi)
+    args = _created_by(gen, count)
+    if args is not None and args['step'] > 0:
+        return range(args['start'], max(hi, args['start']), args['step'])
+    return None
+
+
+def _bounded_primes(lo, hi):
+    """
+    Return a generator of prime numbers p such that lo <= p < hi, picked out by NumPy if available
+    """
+    if np is None:
+        yield from segmented_sieve(lo, hi)
+        return
+    for chunk in array_sieve_chunks(hi, lo=lo):
+        yield from chunk.tolist()
+
+
 def remove_multiples(m, ints):
     """
     Return a generator based on the given one without multiples of the given number
@@ -62,7 +243,9 @@ def sieve(ints):
     """
     Return a generator of prime numbers sieved out of the given generator f ints
 
-    Ints are sieved out with Eratosthenes sieve algorithm.
+    Ints are sieved out with Eratosthenes sieve algorithm. A fresh count() from 2 with step 1
+    or a fresh wheel() from 2 is recognized and sieved in bounded memory by segmented_sieve,
+    any other ascending ints are sieved by incremental_sieve.
     :param ints: a generator of ints
     :return: a generator of prime numbers
 
@@ -75,21 +258,2059 @@ def sieve(ints):
     >>> 7 in take(lambda x: x < 10, sieve(count(start=2, step=1)))
     True
     """
+    # infinite stream of ints starting from 2 is better off with the segmented sieve
+    count_args = _created_by(ints, count)
+    wheel_args = _created_by(ints, wheel)
+    if count_args is not None and (count_args['start'], count_args['step']) == (2, 1):
+        yield from segmented_sieve()
+    elif wheel_args is not None and wheel_args['start'] <= 2:
+        yield from segmented_sieve(modulus=wheel_args['modulus'])
+    else:
+        yield from incremental_sieve(ints)
+
+
+def incremental_sieve(ints):
+    """
+    Return a generator of prime numbers sieved out of the given ascending iterable of ints
+
+    Rather than wrapping the ints into one more remove_multiples generator per prime found,
+    the next upcoming multiple of every prime is kept in a dict, so each int costs amortized
+    O(log log n) steps and the primes are produced at a single generator depth.
+    Just like sieve, yields every int not divisible by any int yielded before it.
+    :param ints: an ascending iterable of positive ints, possibly infinite
+    :return: a generator of prime numbers
+
+    >>> list(incremental_sieve(range(2, 30)))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+
+    >>> list(take(lambda x: x < 30, incremental_sieve(count(start=2, step=1))))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+
+    >>> list(incremental_sieve([2, 3, 5, 7, 9, 11, 13, 15, 25, 29]))
+    [2, 3, 5, 7, 11, 13, 29]
+
+    >>> list(take(lambda x: x < 60, incremental_sieve(wheel(modulus=210))))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59]
+    """
+    count_args = _created_by(ints, count)
+    wheel_args = _created_by(ints, wheel)
+    # an uninterrupted stream from 2 has no composites below p * p left unsieved by smaller primes
+    from_two = (count_args is not None and (count_args['start'], count_args['step']) == (2, 1)
+                or wheel_args is not None and wheel_args['start'] <= 2)
+    # a fresh wheel only has multiples of p by wheel ints, so they are stepped over along the wheel
+    steps, modulus, first = None, 1, 2
+    if wheel_args is not None:
+        modulus = wheel_args['modulus']
+        steps = _wheel_steps(modulus)
+        first = 1 + steps[1]
+    # upcoming multiple -> prime it's a multiple of
+    multiples = {}
+    last = None
+    for n in ints:
+        if last is not None:
+            if n < last:
+                raise ValueError('ints must be ascending, got {} after {}'.format(n, last))
+            if n == last:
+                continue
+            if n - last > 1 and steps is None:
+                _skip_multiples(multiples, last + 1, n)
+        last = n
+
+        prime = multiples.pop(n, None)
+        if prime is None:
+            yield n
+            # multiples of wheel primes never show up on the wheel
+            if steps is not None and modulus % n == 0:
+                continue
+            prime, m = n, n * n if from_two else first * n
+        else:
+            m = n + (prime if steps is None else prime * steps[n // prime % modulus])
+        # keep one prime per multiple, moving collisions to the prime's next multiple
+        while m in multiples:
+            m += prime if steps is None else prime * steps[m // prime % modulus]
+        multiples[m] = prime
+
+
+def _skip_multiples(multiples, lo, hi):
+    """
+    Move multiples in [lo, hi) the ints have skipped over to the primes' next multiples not less than hi
+    """
+    if hi - lo < len(multiples):
+        skipped = [m for m in range(lo, hi) if m in multiples]
+    else:
+        skipped = [m for m in multiples if m < hi]
+    for m in skipped:
+        prime = multiples.pop(m)
+        m += (hi - m + prime - 1) // prime * prime
+        while m in multiples:
+            m += prime
+        multiples[m] = prime
+
+
+def _created_by(gen, function):
+    """
+    Return a dict of arguments gen was created with if it is a generator of the given function, None otherwise
+
+    Generators that have been advanced already are not recognized, as their state is unknown.
+    """
+    if getattr(gen, 'gi_code', None) is not function.__code__:
+        return None
+    if inspect.getgeneratorstate(gen) != inspect.GEN_CREATED:
+        return None
+    return inspect.getgeneratorlocals(gen)
+
+
+@lru_cache(maxsize=None)
+def _wheel_primes(modulus):
+    """
+    Return a tuple of primes dividing the given modulus of a wheel
+    """
+    return tuple(p for p in small_primes(modulus) if modulus % p == 0)
+
+
+@lru_cache(maxsize=None)
+def _wheel_steps(modulus):
+    """
+    Return a tuple of distances from every residue modulo the given modulus to the next residue coprime to it
+    """
+    steps = [0] * modulus
+    for r in range(modulus):
+        step = 1
+        while gcd(r + step, modulus) != 1:
+            step += 1
+        steps[r] = step
+    return tuple(steps)
+
+
+@lru_cache(maxsize=None)
+def _presieve_pattern(modulus):
+    """
+    Return bytes of flags for odd numbers 1, 3, 5, ... with multiples of the odd primes dividing modulus struck out
+
+    The pattern repeats itself every 2 * len(pattern) ints.
+    """
+    primes = _wheel_primes(modulus)[modulus % 2 == 0:]
+    pattern = bytearray([1]) * prod(primes)
+    for p in primes:
+        pattern[p // 2::p] = bytes(len(range(p // 2, len(pattern), p)))
+    return bytes(pattern)
+
+
+def small_primes(limit):
+    """
+    Return a list of all primes not greater than the given limit
+
+    :param limit: an int the primes are bounded by
+    :return: a list of prime numbers
+
+    >>> small_primes(30)
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    >>> small_primes(1)
+    []
+    """
+    if limit < 2:
+        return []
+    # flags[i] stands for an odd number 2 * i + 1
+    flags = bytearray([1]) * ((limit + 1) // 2)
+    flags[0] = 0
+    for i in range(1, (isqrt(limit) + 1) // 2):
+        if flags[i]:
+            p = 2 * i + 1
+            start = p * p // 2
+            flags[start::p] = bytes(len(range(start, len(flags), p)))
+    return [2] + list(compress(range(1, limit + 1, 2), flags))
+
+
+def _sieve_segment(lo, size, base, modulus=2):
+    """
+    Return a bytearray of flags for odd numbers lo, lo + 2, ..., lo + 2 * (size - 1), 1 for a prime
+
+    :param lo: an odd int the segment starts with
+    :param size: number of odd numbers in the segment
+    :param base: ascending odd primes up to at least the square root of the segment's last number
+    :param modulus: an int whose prime factors are pre-sieved with a repeating pattern instead of struck out
+    """
+    hi = lo + 2 * size
+    pattern = _presieve_pattern(modulus)
+    if len(pattern) == 1:
+        flags = bytearray([1]) * size
+    else:
+        i = lo // 2 % len(pattern)
+        flags = bytearray(pattern * ((i + size) // len(pattern) + 1))[i:i + size]
+        # the pattern strikes out wheel primes themselves as well
+        for p in _wheel_primes(modulus):
+            if p != 2 and lo <= p < hi:
+                flags[(p - lo) // 2] = 1
+    for p in base:
+        if modulus % p == 0:
+            continue
+        square = p * p
+        if square >= hi:
+            break
+        # first odd multiple of p within the segment, p itself is never struck out
+        start = max(square, lo + (-lo % p))
+        if not start & 1:
+            start += p
+        i = (start - lo) // 2
+        if i < size:
+            flags[i::p] = bytes((size - 1 - i) // p + 1)
+    if lo == 1:
+        flags[0] = 0
+    return flags
+
+
+def segmented_sieve(lo=2, hi=None, segment_size=SEGMENT_SIZE, modulus=2):
+    """
+    Return a generator of prime numbers p such that lo <= p < hi
+
+    Composites are struck out with Eratosthenes sieve algorithm in fixed-size bytearray segments,
+    one byte per odd number, so besides a segment only base primes up to the square root
+    of the segment's end are kept in memory no matter how far the generator runs.
+    :param lo: an int primes start from
+    :param hi: an int primes are less than, None for an infinite generator
+    :param segment_size: number of odd numbers sieved at a time
+    :param modulus: an int of a wheel whose primes are pre-sieved with a repeating pattern, see wheel
+    :return: a generator of prime numbers
+
+    >>> list(segmented_sieve(hi=30))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+
+    >>> list(segmented_sieve(100, 130, segment_size=4))
+    [101, 103, 107, 109, 113, 127]
+
+    >>> list(take(lambda x: x < 10**5, segmented_sieve()))[-1]
+    99991
+
+    >>> list(take(lambda x: x < 30, sieve(wheel(modulus=210))))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    """
+    if lo <= 2 and (hi is None or hi > 2):
+        yield 2
+    for start, size, flags in _segments(max(lo, 3) | 1, hi, segment_size, modulus):
+        yield from compress(range(start, start + 2 * size, 2), flags)
+
+
+def _segments(lo, hi, segment_size, modulus=2, extra=0):
+    """
+    Return a generator of (start, size, flags) for consecutive segments of odd numbers from lo up to hi
+
+    :param lo: an odd int the first segment starts with
+    :param hi: an int segments end before, None for an infinite generator
+    :param segment_size: number of odd numbers in a segment
+    :param modulus: an int of a wheel whose primes are pre-sieved
+    :param extra: number of odd numbers past every segment its flags cover as well
+    """
+    for start, size, base in _segment_schedule(lo, hi, segment_size, extra):
+        yield start, size, _sieve_segment(start, size + extra, base, modulus)
+
+
+def _segment_schedule(lo, hi, segment_size, extra=0):
+    """
+    Return a generator of (start, size, base) for consecutive segments of odd numbers from lo up to hi
+
+    Base primes are odd primes up to at least the square root of the last number of a segment,
+    grown by doubling their limit, so they're recomputed only a logarithmic number of times.
+    :param lo: an odd int the first segment starts with
+    :param hi: an int segments end before, None for an infinite generator
+    :param segment_size: number of odd numbers in a segment
+    :param extra: number of odd numbers past every segment its base primes cover as well
+    """
+    # odd base primes up to base_limit
+    base, base_limit = [], 1
+    while hi is None or lo < hi:
+        size = segment_size if hi is None else min(segment_size, (hi - lo + 1) // 2)
+        last = lo + 2 * (size + extra - 1)
+        if base_limit * base_limit < last:
+            base_limit = max(isqrt(last), 2 * base_limit)
+            base = small_primes(base_limit)[1:]
+        yield lo, size, base
+        lo += 2 * size
+
+
+def _admissible(pattern):
+    """
+    Return True if the given offsets don't cover every residue modulo any prime, False otherwise
+    """
+    return all(len({o % p for o in pattern}) < p for p in small_primes(len(pattern)))
+
+
+def constellations(patterns, hi=None, *, lo=2, segment_size=SEGMENT_SIZE):
+    """
+    Return a generator of (p, pattern) for every prime p such that p + o is prime for all offsets o of a pattern
+
+    Flags of a sieved segment are turned into a bitmap, a pattern is matched against the whole
+    segment at once by and-ing the bitmap shifted by each of its offsets.
+    :param patterns: an iterable of admissible patterns, ascending offsets from 0 like (0, 2) for twin primes
+    :param hi: an int the first primes of matches are less than, None for an infinite generator
+    :param lo: an int the first primes of matches start from
+    :param segment_size: number of odd numbers sieved at a time
+    :return: a generator of (prime number, pattern) tuples ascending by prime
+
+    >>> list(constellations([(0, 2), (0, 4)], 20))
+    [(3, (0, 2)), (3, (0, 4)), (5, (0, 2)), (7, (0, 4)), (11, (0, 2)), (13, (0, 4)), (17, (0, 2)), (19, (0, 4))]
+
+    >>> [p for p, _ in constellations([(0, 2, 6, 8)], 10 ** 4)]
+    [5, 11, 101, 191, 821, 1481, 1871, 2081, 3251, 3461, 5651, 9431]
+    """
+    patterns = [tuple(pattern) for pattern in patterns]
+    for pattern in patterns:
+        if pattern[0] != 0 or list(pattern) != sorted(set(pattern)) or not _admissible(pattern):
+            raise ValueError('{} is not an admissible pattern'.format(pattern))
+    if (0,) in patterns and lo <= 2 and (hi is None or hi > 2):
+        yield 2, (0,)
+    # offsets of patterns with more than one prime are even, so only odd primes can start them
+    extra = max(pattern[-1] for pattern in patterns) // 2
+    for start, size, flags in _segments(max(lo, 3) | 1, hi, segment_size, extra=extra):
+        bits = int(flags[::-1].translate(_FLAG_DIGITS), 2)
+        matches = []
+        for pattern in patterns:
+            found = bits
+            for o in pattern[1:]:
+                found &= bits >> (o // 2)
+            found &= (1 << size) - 1
+            found_flags = _unpack_bits(found.to_bytes(-(-size // 8), 'little'))[:size]
+            matches += ((p, pattern) for p in compress(range(start, start + 2 * size, 2), found_flags))
+        matches.sort(key=lambda match: match[0])
+        yield from matches
+
+
+def prime_gaps(hi, *, lo=2, segment_size=SEGMENT_SIZE):
+    """
+    Return statistics of gaps between consecutive primes p such that lo <= p < hi
+
+    :param hi: an int primes are less than
+    :param lo: an int primes start from
+    :param segment_size: number of odd numbers sieved at a time
+    :return: a dict with 'count' of primes, 'histogram' Counter of gaps, and 'maximal' gaps
+             as (gap, p) tuples for every gap after p greater than all the gaps before it
+
+    >>> stats = prime_gaps(100)
+    >>> stats['count'], stats['maximal']
+    (25, [(1, 2), (2, 3), (4, 7), (6, 23), (8, 89)])
+    >>> sorted(stats['histogram'].items())
+    [(1, 1), (2, 8), (4, 7), (6, 7), (8, 1)]
+    """
+    count, histogram, maximal = 0, Counter(), []
+    # the last prime of the previous segment, the gap after it is in the next one
+    last = []
+    if lo <= 2 < hi:
+        count, last = 1, [2]
+    for start, size, flags in _segments(max(lo, 3) | 1, hi, segment_size):
+        primes = last + list(compress(range(start, start + 2 * size, 2), flags))
+        count += len(primes) - len(last)
+        gaps = list(map(int.__sub__, primes[1:], primes[:-1]))
+        histogram.update(gaps)
+        if gaps and max(gaps) > (maximal[-1][0] if maximal else 0):
+            for p, gap in zip(primes, gaps):
+                if gap > (maximal[-1][0] if maximal else 0):
+                    maximal.append((gap, p))
+        last = primes[-1:]
+    return {'count': count, 'histogram': histogram, 'maximal': maximal}
+
+
+def primes_between(lo, hi, segment_size=SEGMENT_SIZE):
+    """
+    Return a generator of prime numbers p such that lo <= p < hi without sieving anything below lo
+
+    Only the window is sieved segment by segment, with base primes up to the square root of hi.
+    :param lo: an int primes start from
+    :param hi: an int primes are less than
+    :param segment_size: number of odd numbers sieved at a time
+    :return: a generator of prime numbers
+
+    >>> list(primes_between(10 ** 12, 10 ** 12 + 100))
+    [1000000000039, 1000000000061, 1000000000063, 1000000000091]
+    """
+    return segmented_sieve(lo, hi, segment_size)
+
+
+def prime_stream(start=2, segment_size=SEGMENT_SIZE):
+    """
+    Return an infinite generator of prime numbers starting from the given value that can be repositioned
+
+    Sending an int to the generator makes it jump to the first prime not less than that int,
+    the same way count() jumps to the int sent; only segments past it are sieved.
+    :param start: an int primes start from
+    :param segment_size: number of odd numbers sieved at a time
+    :return: an infinite generator
+
+    >>> P = prime_stream()
+    >>> next(P), next(P), next(P)
+    (2, 3, 5)
+    >>> P.send(10 ** 12)
+    1000000000039
+    >>> next(P)
+    1000000000061
+    >>> P.send(90)
+    97
+    """
+    lo = start
     while True:
-        prime = next(ints)
-        yield prime
-        ints = remove_multiples(prime, ints)
+        for p in segmented_sieve(lo, segment_size=segment_size):
+            val = (yield p)
+            # if .send() method invoked
+            if val is not None:
+                lo = val
+                break
 
 
-def fib():
+def _segment_primes(lo, size, base):
     """
-    Return a generator of Fibonacci sequence
-    :return: a generator of Fibinacci numbers
+    Return a list of primes among odd numbers lo, lo + 2, ..., lo + 2 * (size - 1)
+    """
+    return list(compress(range(lo, lo + 2 * size, 2), _sieve_segment(lo, size, base)))
 
-    >>> list(take(lambda x: x < 100, fib()))
-    [0, 1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89]
+
+async def aprimes(lo=2, hi=None, segment_size=SEGMENT_SIZE, executor=None):
     """
-    a, b = 0, 1
+    Return an asynchronous generator of prime numbers p such that lo <= p < hi
+
+    Primes are sieved in segments the way segmented_sieve does, control is handed back
+    to the event loop after every segment, so other coroutines wait at most for one segment.
+    With an executor segments are sieved in it instead, the next one while the current
+    one is being consumed, so the loop only ever iterates over ready lists of primes.
+    :param lo: an int primes start from
+    :param hi: an int primes are less than, None for an infinite generator
+    :param segment_size: number of odd numbers sieved at a time
+    :param executor: a concurrent.futures.Executor to sieve segments in, None to sieve in the event loop
+    :return: an asynchronous generator of prime numbers
+
+    >>> async def collect(**kwargs):
+    ...     return [p async for p in aprimes(**kwargs)]
+    >>> asyncio.run(collect(hi=30, segment_size=4))
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(1) as executor:
+    ...     asyncio.run(collect(lo=100, hi=130, segment_size=4, executor=executor))
+    [101, 103, 107, 109, 113, 127]
+    """
+    loop = asyncio.get_running_loop()
+    if lo <= 2 and (hi is None or hi > 2):
+        yield 2
+    pending = None
+    for start, size, base in _segment_schedule(max(lo, 3) | 1, hi, segment_size):
+        if executor is None:
+            for p in _segment_primes(start, size, base):
+                yield p
+        else:
+            current, pending = pending, loop.run_in_executor(executor, _segment_primes, start, size, base)
+            if current is not None:
+                for p in await current:
+                    yield p
+        await asyncio.sleep(0)
+    if pending is not None:
+        for p in await pending:
+            yield p
+
+
+def array_sieve_chunks(hi, *, lo=2, chunk_size=SEGMENT_SIZE * 8):
+    """
+    Return a generator of NumPy arrays with ascending prime numbers p such that lo <= p < hi
+
+    Each chunk is struck out in a bytearray segment, then its primes are picked out with NumPy
+    in one go, so no Python int is ever boxed per prime.
+    :param hi: an int primes are less than
+    :param lo: an int primes start from
+    :param chunk_size: number of odd numbers sieved per chunk
+    :return: a generator of int64 ndarrays
+
+    >>> [chunk.tolist() for chunk in array_sieve_chunks(30, chunk_size=5)]
+    [[2, 3, 5, 7, 11], [13, 17, 19], [23, 29]]
+    """
+    if np is None:
+        raise ImportError('array_sieve_chunks requires NumPy')
+    base = small_primes(isqrt(max(hi - 1, 0)))[1:]
+    head = [2] if lo <= 2 < hi else []
+    lo = max(lo, 3) | 1
+    while lo < hi:
+        size = min(chunk_size, (hi - lo + 1) // 2)
+        flags = np.frombuffer(_sieve_segment(lo, size, base), dtype=np.bool_)
+        chunk = np.flatnonzero(flags).astype(np.int64) * 2 + lo
+        if head:
+            chunk = np.concatenate((np.array(head, dtype=np.int64), chunk))
+            head = []
+        yield chunk
+        lo += 2 * size
+    if head:
+        yield np.array(head, dtype=np.int64)
+
+
+def array_sieve(hi, *, lo=2, chunk_size=SEGMENT_SIZE * 8):
+    """
+    Return a NumPy array of all prime numbers p such that lo <= p < hi
+
+    :param hi: an int primes are less than
+    :param lo: an int primes start from
+    :param chunk_size: number of odd numbers sieved at a time
+    :return: an int64 ndarray of prime numbers
+
+    >>> array_sieve(30).tolist()
+    [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    >>> array_sieve(30, lo=10).tolist()
+    [11, 13, 17, 19, 23, 29]
+
+    >>> array_sieve(10**5).tolist() == list(take(lambda x: x < 10**5, sieve(count(start=2, step=1))))
+    True
+    """
+    chunks = list(array_sieve_chunks(hi, lo=lo, chunk_size=chunk_size))
+    if not chunks:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def parallel_sieve_chunks(hi, *, lo=2, segment_size=SEGMENT_SIZE * 8, workers=None):
+    """
+    Return a generator of arrays with ascending prime numbers p such that lo <= p < hi sieved in parallel
+
+    Disjoint segments of [lo, hi) are handed out to a pool of worker processes, base primes are
+    computed once and passed to every worker when it starts. Chunks are yielded in ascending order
+    with at most two segments per worker in flight, so memory use doesn't depend on the range.
+    Workers pick primes out of their segments with NumPy if it's available, like array_sieve_chunks.
+    :param hi: an int primes are less than
+    :param lo: an int primes start from
+    :param segment_size: number of odd numbers sieved by a worker at a time
+    :param workers: number of worker processes, os.cpu_count() if None
+    :return: a generator of int64 ndarrays, or of array('q') chunks without NumPy
+
+    >>> [chunk.tolist() for chunk in parallel_sieve_chunks(60, segment_size=8, workers=2)]
+    [[2, 3, 5, 7, 11, 13, 17], [19, 23, 29, 31], [37, 41, 43, 47], [53, 59]]
+    """
+    workers = workers or os.cpu_count()
+    base = small_primes(isqrt(max(hi - 1, 0)))[1:]
+    head = [2] if lo <= 2 < hi else []
+    lo = max(lo, 3) | 1
+    segments = ((start, min(segment_size, (hi - start + 1) // 2)) for start in range(lo, hi, 2 * segment_size))
+
+    with ProcessPoolExecutor(workers, initializer=_init_sieve_worker, initargs=(base,)) as pool:
+        pending = deque()
+        for segment in segments:
+            pending.append(pool.submit(_sieve_worker, segment))
+            if len(pending) < 2 * workers:
+                continue
+            yield _prepend(head, pending.popleft().result())
+            head = []
+        while pending:
+            yield _prepend(head, pending.popleft().result())
+            head = []
+    if head:
+        yield np.array(head, dtype=np.int64) if np is not None else array('q', head)
+
+
+def parallel_sieve(hi, *, lo=2, segment_size=SEGMENT_SIZE * 8, workers=None):
+    """
+    Return a generator of prime numbers p such that lo <= p < hi sieved by a pool of worker processes
+
+    See parallel_sieve_chunks.
+    :param hi: an int primes are less than
+    :param lo: an int primes start from
+    :param segment_size: number of odd numbers sieved by a worker at a time
+    :param workers: number of worker processes, os.cpu_count() if None
+    :return: a generator of prime numbers
+
+    >>> list(parallel_sieve(10**5, workers=2)) == list(segmented_sieve(hi=10**5))
+    True
+    """
+    for chunk in parallel_sieve_chunks(hi, lo=lo, segment_size=segment_size, workers=workers):
+        yield from chunk.tolist()
+
+
+# base primes of a worker process, set once by _init_sieve_worker
+_worker_base = []
+
+
+def _init_sieve_worker(base):
+    global _worker_base
+    _worker_base = base
+
+
+def _sieve_worker(segment):
+    """
+    Return an int64 ndarray, or an array('q') without NumPy, of primes in the given (lo, size) segment of odd numbers
+    """
+    lo, size = segment
+    flags = _sieve_segment(lo, size, _worker_base)
+    if np is not None:
+        return np.flatnonzero(np.frombuffer(flags, dtype=np.bool_)).astype(np.int64) * 2 + lo
+    return array('q', compress(range(lo, lo + 2 * size, 2), flags))
+
+
+def _prepend(head, chunk):
+    """
+    Return a chunk of primes returned by _sieve_worker with the given list of primes put in front of it
+    """
+    if not head:
+        return chunk
+    if np is not None:
+        return np.concatenate((np.array(head, dtype=np.int64), chunk))
+    return array('q', head) + chunk
+
+
+# translation tables between 0/1 flag bytes and ASCII binary digits
+_FLAG_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_DIGIT_FLAGS = bytes.maketrans(b'01', b'\x00\x01')
+# number of bits set in every byte
+_POPCOUNT = bytes(bin(i).count('1') for i in range(256))
+
+
+def _pack_bits(flags):
+    """
+    Return bytes with the given 0/1 flags packed into bits, least significant bit first
+
+    >>> _pack_bits(bytes([1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1]))
+    b'\\x01\\x82'
+    """
+    return int(flags[::-1].translate(_FLAG_DIGITS), 2).to_bytes(len(flags) // 8, 'little')
+
+
+def _unpack_bits(data):
+    """
+    Return bytes with a 0/1 flag per bit of the given data, least significant bit first
+
+    >>> list(_unpack_bits(b'\\x01\\x82'))
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1]
+    """
+    digits = format(int.from_bytes(data, 'little'), 'b').zfill(8 * len(data))
+    return digits[::-1].encode().translate(_DIGIT_FLAGS)
+
+
+def _packed_bitmap(lo, hi):
+    """
+    Return a generator of bytes with bits set for odd primes in [lo, hi), one bit per odd number
+
+    :param lo: a multiple of 16 the bitmap starts from
+    :param hi: a multiple of 16 the bitmap ends with
+    """
+    base = small_primes(isqrt(hi))[1:]
+    size = SEGMENT_SIZE * 8
+    for start in range(lo + 1, hi, 2 * size):
+        yield _pack_bits(_sieve_segment(start, min(size, (hi - start + 1) // 2), base))
+
+
+class PrimeBitmap:
+    """
+    A prime bitmap stored in a file and memory-mapped for zero-copy reads shared by many processes
+
+    The file holds a header with the bitmap's limit followed by one bit per odd number below it,
+    set for a prime. Queries past the limit extend the file lazily under an exclusive file lock,
+    other processes pick the extension up when they query past their own mapping.
+    :param path: a path to the bitmap file, created if it doesn't exist
+    :param limit: an int the bitmap is extended to cover numbers below right away
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'primes.bin')
+    >>> with PrimeBitmap(path, 100) as bitmap:
+    ...     97 in bitmap, 91 in bitmap, list(bitmap.primes(hi=30))
+    (True, False, [2, 3, 5, 7, 11, 13, 17, 19, 23, 29])
+
+    >>> bitmap = PrimeBitmap(path)
+    >>> bitmap.limit
+    112
+    >>> 1009 in bitmap
+    True
+    >>> bitmap.limit
+    1024
+    >>> list(bitmap.primes(1000, 1050))
+    [1009, 1013, 1019, 1021, 1031, 1033, 1039, 1049]
+    >>> bitmap.close()
+    """
+    MAGIC = b'PRIMEBMP'
+    HEADER = struct.Struct('<8sQ')
+
+    def __init__(self, path, limit=0):
+        self.path = path
+        self.limit = 0
+        self._map = None
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._lock():
+            if os.fstat(self._fd).st_size < self.HEADER.size:
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, 0), 0)
+            self._remap()
+        self.extend(limit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, n):
+        if n < 3 or not n & 1:
+            return n == 2
+        if n >= self.limit:
+            self.extend(max(n + 1, 2 * self.limit))
+        i = n // 2
+        return bool(self._map[self.HEADER.size + (i >> 3)] >> (i & 7) & 1)
+
+    def __iter__(self):
+        return self.primes()
+
+    def close(self):
+        if self._map is not None:
+            self._unmap()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def extend(self, limit):
+        """
+        Extend the bitmap to cover all numbers below the given limit, rounded up to a multiple of 16
+
+        :param limit: an int the bitmap should cover numbers below
+        """
+        limit = -(-limit // 16) * 16
+        if limit <= self.limit:
+            return
+        with self._lock():
+            # another process may have extended the file already
+            self._remap()
+            if limit <= self.limit:
+                return
+            offset = self.HEADER.size + self.limit // 16
+            for packed in _packed_bitmap(self.limit, limit):
+                os.pwrite(self._fd, packed, offset)
+                offset += len(packed)
+            # the limit is written last, so that readers never see bits that aren't there yet
+            os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, limit), 0)
+            self._remap()
+
+    def bits(self, start=0, stop=None):
+        """
+        Return bytes of the bitmap from start up to stop, byte b stands for odd numbers 16 * b + 1 to 16 * b + 15
+
+        :param start: an int index of the first byte
+        :param stop: an int index the bytes end before, the end of the bitmap if None
+        :return: bytes
+        """
+        stop = self.limit // 16 if stop is None else min(stop, self.limit // 16)
+        return self._map[self.HEADER.size + start:self.HEADER.size + stop]
+
+    def primes(self, lo=2, hi=None):
+        """
+        Return a generator of prime numbers p such that lo <= p < hi read from the bitmap
+
+        :param lo: an int primes start from
+        :param hi: an int primes are less than, None for an infinite generator extending the bitmap as it goes
+        :return: a generator of prime numbers
+        """
+        if hi is not None:
+            self.extend(hi)
+        if lo <= 2 and (hi is None or hi > 2):
+            yield 2
+        n = max(lo, 3) | 1
+        while hi is None or n < hi:
+            if n >= self.limit:
+                self.extend(2 * n)
+            # a byte of the bitmap stands for 8 odd numbers, 16 * b + 1 up to 16 * b + 15
+            start = n // 16
+            stop = min(start + SEGMENT_SIZE, self.limit // 16)
+            flags = _unpack_bits(self.bits(start, stop))
+            end = 16 * stop if hi is None else min(16 * stop, hi)
+            i, j = (n - 16 * start) // 2, (end - 16 * start) // 2
+            yield from compress(range(n, end, 2), flags[i:j])
+            n = 16 * stop + 1
+
+    @contextmanager
+    def _lock(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _remap(self):
+        magic, limit = self.HEADER.unpack(os.pread(self._fd, self.HEADER.size, 0))
+        if magic != self.MAGIC:
+            raise ValueError('{} is not a prime bitmap file'.format(self.path))
+        if self._map is not None:
+            self._unmap()
+        self._map = mmap.mmap(self._fd, self.HEADER.size + limit // 16, access=mmap.ACCESS_READ)
+        self.limit = limit
+
+    def _unmap(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # memoryviews of the mapping are still in use, like bits of a PrimeIndex, it's unmapped once they're gone
+            pass
+        self._map = None
+
+
+# header of a prime file: magic, version, primes per block, number of primes, number of blocks, index offset
+_PRIME_FILE_HEADER = struct.Struct('<8sIIQQQ')
+_PRIME_FILE_MAGIC = b'PRIMEGAP'
+# halved gaps below 128 to gaps
+_HALF_GAPS = bytes([2 * h for h in range(128)] + [0] * 128)
+
+
+def _varint(n):
+    """
+    Return bytes of the given non-negative int in LEB128 encoding, 7 bits per byte
+    """
+    data = bytearray()
+    while n >= 0x80:
+        data.append(n & 0x7f | 0x80)
+        n >>= 7
+    data.append(n)
+    return bytes(data)
+
+
+def _read_varint(data, i):
+    """
+    Return (int, index past it) read from LEB128 encoded data starting at index i
+    """
+    n = shift = 0
     while True:
-        yield a
-        a, b = b, (a + b)
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+
+def _encode_prime_block(block):
+    """
+    Return bytes of the first prime of the block followed by halved gaps between its primes, all varints
+
+    The only odd gap, the one from 2, is halved rounding down like the others.
+    """
+    halves = [gap >> 1 for gap in map(sub, block[1:], block[:-1])]
+    if not halves or max(halves) < 0x80:
+        return _varint(int(block[0])) + bytes(halves)
+    return _varint(int(block[0])) + b''.join(_varint(int(half)) for half in halves)
+
+
+def _decode_prime_block(data, as_array=False):
+    """
+    Return a list of primes, or an int64 ndarray if as_array, decoded from bytes made by _encode_prime_block
+    """
+    first, i = _read_varint(data, 0)
+    if first == 2 and i < len(data):
+        # the gap from 2 to the next prime is odd
+        half, i = _read_varint(data, i)
+        block = _decode_prime_gaps(3 + 2 * half, data, i, as_array)
+        return np.concatenate((np.array([2], dtype=np.int64), block)) if as_array else [2] + block
+    return _decode_prime_gaps(first, data, i, as_array)
+
+
+def _decode_prime_gaps(first, data, i, as_array):
+    """
+    Return a list of primes, or an int64 ndarray if as_array, from first followed by halved gaps in data from index i
+    """
+    halves = data[i:]
+    # gaps below 256 take a byte each, which is nearly always the case
+    if halves.isascii():
+        gaps = halves.translate(_HALF_GAPS)
+        if as_array:
+            return np.cumsum(np.frombuffer(b'\x00' + gaps, dtype=np.uint8), dtype=np.int64) + first
+        return list(accumulate(gaps, initial=first))
+    block = [first]
+    while i < len(data):
+        half, i = _read_varint(data, i)
+        block.append(block[-1] + 2 * half)
+    return np.array(block, dtype=np.int64) if as_array else block
+
+
+def write_prime_file(path, primes, block_size=PRIME_FILE_BLOCK):
+    """
+    Write ascending primes from the given iterable to a compact binary file, return the number of primes written
+
+    Primes are stored in blocks of block_size, every one starting with its first prime followed by
+    halved gaps between primes as varints, mostly a byte per prime. An index of the blocks' first
+    primes and offsets at the end of the file lets readers seek to any prime.
+    :param path: a path to the file, overwritten if it exists
+    :param primes: an iterable of ascending prime numbers, like any generator of this module
+    :param block_size: number of primes per block
+    :return: an int
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'primes.gap')
+    >>> write_prime_file(path, segmented_sieve(hi=10 ** 6), block_size=1000)
+    78498
+    >>> os.path.getsize(path) < 90000
+    True
+    >>> list(read_prime_file(path, 999900))
+    [999907, 999917, 999931, 999953, 999959, 999961, 999979, 999983]
+
+    >>> write_prime_file(path, array_sieve(10 ** 5), block_size=1000)
+    9592
+    >>> list(read_prime_file(path)) == list(segmented_sieve(hi=10 ** 5))
+    True
+    >>> write_prime_file(path, [2, 5, 7, 13])
+    4
+    >>> list(read_prime_file(path))
+    [2, 5, 7, 13]
+    """
+    primes = iter(primes)
+    index = array('Q')
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(bytes(_PRIME_FILE_HEADER.size))
+        for block in iter(lambda: list(islice(primes, block_size)), []):
+            index += array('Q', [int(block[0]), f.tell()])
+            f.write(_encode_prime_block(block))
+            count += len(block)
+        index_offset = f.tell()
+        if sys.byteorder != 'little':
+            index.byteswap()
+        f.write(index.tobytes())
+        f.seek(0)
+        f.write(_PRIME_FILE_HEADER.pack(_PRIME_FILE_MAGIC, 1, block_size, count, len(index) // 2, index_offset))
+    return count
+
+
+def read_prime_file_blocks(path, lo=2, hi=None, as_array=None):
+    """
+    Return a generator of blocks of primes p such that lo <= p < hi read from a file made by write_prime_file
+
+    Blocks before lo are skipped with the file's index, so only the blocks with the primes
+    wanted are read and decoded.
+    :param path: a path to a prime file
+    :param lo: an int primes start from
+    :param hi: an int primes are less than, None for all the primes of the file
+    :param as_array: if True, blocks are int64 NumPy arrays, lists otherwise; arrays if NumPy is available when None
+    :return: a generator of lists or ndarrays of prime numbers
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'primes.gap')
+    >>> write_prime_file(path, segmented_sieve(hi=50), block_size=4)
+    15
+    >>> [block.tolist() for block in read_prime_file_blocks(path, 10, 40, as_array=True)]
+    [[11, 13, 17, 19], [23, 29, 31, 37]]
+    """
+    if as_array is None:
+        as_array = np is not None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, _, _, _, blocks, index_offset = _PRIME_FILE_HEADER.unpack_from(data)
+        if magic != _PRIME_FILE_MAGIC:
+            raise ValueError('{} is not a prime file'.format(path))
+        index = array('Q', data[index_offset:index_offset + 16 * blocks])
+        if sys.byteorder != 'little':
+            index.byteswap()
+        firsts, offsets = index[::2], index[1::2] + array('Q', [index_offset])
+        for b in range(max(bisect_left(firsts, lo + 1) - 1, 0), blocks):
+            if hi is not None and firsts[b] >= hi:
+                break
+            block = _decode_prime_block(data[offsets[b]:offsets[b + 1]], as_array)
+            if block[0] < lo or hi is not None and block[-1] >= hi:
+                if as_array:
+                    block = block[np.searchsorted(block, lo):np.searchsorted(block, hi if hi is not None else block[-1] + 1)]
+                else:
+                    block = block[bisect_left(block, lo):bisect_left(block, hi if hi is not None else block[-1] + 1)]
+            if len(block):
+                yield block
+
+
+def read_prime_file(path, lo=2, hi=None):
+    """
+    Return a generator of primes p such that lo <= p < hi read from a file made by write_prime_file
+
+    :param path: a path to a prime file
+    :param lo: an int primes start from
+    :param hi: an int primes are less than, None for all the primes of the file
+    :return: a generator of prime numbers
+    """
+    for block in read_prime_file_blocks(path, lo, hi, as_array=False):
+        yield from block
+
+
+class PrimeIndex:
+    """
+    A prime bitmap with popcount rank blocks answering prime queries in constant or logarithmic time
+
+    Each block of BLOCK bytes of the bitmap has the number of primes before it stored, so counting
+    primes takes a single popcount within a block and finding the n-th prime a binary search over blocks.
+    Queries past the limit extend the index lazily. Batch versions of the queries take an iterable
+    and return a list, or take a NumPy array and return an array.
+    :param limit: an int the index covers numbers below right away
+    :param bitmap: a PrimeBitmap to read bits from and extend instead of sieving in memory, its mapping is
+                   read in place rather than copied
+
+    >>> index = PrimeIndex(100)
+    >>> index.is_prime(97), index.prime_count(100), index.nth_prime(25)
+    (True, 25, 97)
+    >>> index.next_prime(97), index.prev_prime(97)
+    (101, 89)
+    >>> index.nth_prime(10**4)
+    104729
+    >>> index.prime_count_many([1, 2, 10, 104729])
+    [0, 1, 4, 10000]
+    >>> index.is_prime_many(np.arange(10)).tolist()
+    [False, False, True, True, False, True, False, True, False, False]
+    """
+    # bytes of the bitmap per rank block, 1024 ints
+    BLOCK = 64
+
+    def __init__(self, limit=1 << 16, bitmap=None):
+        self.limit = 0
+        self._bitmap = bitmap
+        self._bits = b''
+        # number of odd primes before every complete block
+        self._ranks = array('Q', [0])
+        self.extend(limit)
+
+    def extend(self, limit):
+        """
+        Extend the index to cover all numbers below the given limit, rounded up to a multiple of 16
+
+        :param limit: an int the index should cover numbers below
+        """
+        limit = -(-limit // 16) * 16
+        if limit <= self.limit:
+            return
+        if self._bitmap is None:
+            # bytes are immutable, so that NumPy views of them made by batch queries stay valid
+            self._bits += b''.join(_packed_bitmap(self.limit, limit))
+        else:
+            bitmap = self._bitmap
+            bitmap.extend(limit)
+            # a view of the shared mapping, which stays valid after the bitmap remaps a larger one
+            self._bits = memoryview(bitmap._map)[bitmap.HEADER.size:bitmap.HEADER.size + bitmap.limit // 16]
+        self.limit = 16 * len(self._bits)
+        bits, ranks, block = self._bits, self._ranks, self.BLOCK
+        for b in range(len(ranks) - 1, len(bits) // block):
+            ranks.append(ranks[-1] + int.from_bytes(bits[b * block:(b + 1) * block], 'little').bit_count())
+
+    def is_prime(self, n):
+        """
+        Return True if the given int is prime, False otherwise
+
+        :param n: an int
+        :return: boolean
+        """
+        if n < 3 or not n & 1:
+            return n == 2
+        if n >= self.limit:
+            self.extend(max(n + 1, 2 * self.limit))
+        i = n // 2
+        return bool(self._bits[i >> 3] >> (i & 7) & 1)
+
+    def prime_count(self, n):
+        """
+        Return the number of primes not greater than the given int
+
+        :param n: an int
+        :return: an int
+        """
+        if n < 2:
+            return 0
+        if n >= self.limit:
+            self.extend(max(n + 1, 2 * self.limit))
+        return 1 + self._rank((n + 1) // 2)
+
+    def nth_prime(self, k):
+        """
+        Return the k-th prime number, counting from nth_prime(1) == 2
+
+        :param k: a positive int
+        :return: a prime number
+        """
+        if k < 1:
+            raise ValueError('k must be positive, got {}'.format(k))
+        if k == 1:
+            return 2
+        # looking for the m-th odd prime
+        m = k - 1
+        while self._rank(8 * len(self._bits)) < m:
+            self.extend(max(2 * self.limit, _nth_prime_bound(k)))
+        bits, block = self._bits, self.BLOCK
+        i = (bisect_left(self._ranks, m) - 1) * block
+        m -= self._ranks[i // block]
+        while _POPCOUNT[bits[i]] < m:
+            m -= _POPCOUNT[bits[i]]
+            i += 1
+        for r in range(8):
+            m -= bits[i] >> r & 1
+            if not m:
+                return 2 * (8 * i + r) + 1
+
+    def next_prime(self, n):
+        """
+        Return the smallest prime greater than the given int
+
+        :param n: an int
+        :return: a prime number
+        """
+        return self.nth_prime(self.prime_count(n) + 1)
+
+    def prev_prime(self, n):
+        """
+        Return the largest prime less than the given int
+
+        :param n: an int greater than 2
+        :return: a prime number
+        """
+        if n <= 2:
+            raise ValueError('there are no primes less than {}'.format(n))
+        return self.nth_prime(self.prime_count(n - 1))
+
+    def is_prime_many(self, ns):
+        """
+        Return is_prime for every int of the given iterable or NumPy array
+
+        :param ns: an iterable of ints or a NumPy array of ints
+        :return: a list of booleans, or a boolean array for an array
+        """
+        if np is None or not isinstance(ns, np.ndarray):
+            return [self.is_prime(n) for n in ns]
+        ns = ns.astype(np.int64)
+        if ns.size:
+            self.extend(int(ns.max()) + 1)
+        bits = np.frombuffer(self._bits, dtype=np.uint8)
+        i = np.maximum(ns, 0) // 2
+        odd = (bits[i >> 3] >> (i & 7) & 1).astype(bool) & (ns & 1 == 1) & (ns > 2)
+        return odd | (ns == 2)
+
+    def prime_count_many(self, ns):
+        """
+        Return prime_count for every int of the given iterable or NumPy array
+
+        :param ns: an iterable of ints or a NumPy array of ints
+        :return: a list of ints, or an int64 array for an array
+        """
+        if np is None or not isinstance(ns, np.ndarray):
+            return [self.prime_count(n) for n in ns]
+        ns = ns.astype(np.int64)
+        if ns.size:
+            self.extend(int(ns.max()) + 1)
+        bits = np.frombuffer(self._bits, dtype=np.uint8)
+        popcount = np.frombuffer(_POPCOUNT, dtype=np.uint8).astype(np.int64)
+        # the same as _rank, vectorized over queries
+        i = np.maximum(ns + 1, 0) // 2
+        byte, r = i >> 3, i & 7
+        first = byte // self.BLOCK * self.BLOCK
+        counts = np.array(self._ranks, dtype=np.int64)[byte // self.BLOCK]
+        for j in range(self.BLOCK):
+            counts += np.where(first + j < byte, popcount[bits[np.minimum(first + j, len(bits) - 1)]], 0)
+        partial = bits[np.minimum(byte, len(bits) - 1)] & ((1 << r) - 1)
+        counts += np.where(byte < len(bits), popcount[partial], 0)
+        return np.where(ns < 2, 0, counts + 1)
+
+    def nth_prime_many(self, ks):
+        """
+        Return nth_prime for every int of the given iterable or NumPy array
+        """
+        return self._many(self.nth_prime, ks)
+
+    def next_prime_many(self, ns):
+        """
+        Return next_prime for every int of the given iterable or NumPy array
+        """
+        return self._many(self.next_prime, ns)
+
+    def prev_prime_many(self, ns):
+        """
+        Return prev_prime for every int of the given iterable or NumPy array
+        """
+        return self._many(self.prev_prime, ns)
+
+    def _many(self, query, ns):
+        results = [query(int(n)) for n in ns]
+        if np is not None and isinstance(ns, np.ndarray):
+            return np.array(results, dtype=np.int64)
+        return results
+
+    def _rank(self, i):
+        """
+        Return the number of bits set among the first i bits of the bitmap
+        """
+        byte, r = divmod(i, 8)
+        first = byte // self.BLOCK * self.BLOCK
+        data = int.from_bytes(self._bits[first:byte + 1], 'little')
+        return self._ranks[first // self.BLOCK] + (data & ((1 << (8 * (byte - first) + r)) - 1)).bit_count()
+
+
+def _nth_prime_bound(k):
+    """
+    Return an int greater than the k-th prime
+    """
+    if k < 6:
+        return 16
+    return int(k * (log(k) + log(log(k)))) + 16
+
+
+# index answering module-level prime queries, created on first use
+_prime_index = None
+
+
+def prime_index():
+    """
+    Return the PrimeIndex module-level prime queries are answered by, see its batch queries
+
+    :return: a PrimeIndex
+    """
+    global _prime_index
+    if _prime_index is None:
+        _prime_index = PrimeIndex()
+    return _prime_index
+
+
+def is_prime(n):
+    """
+    Return True if the given int is prime, False otherwise
+
+    Ints below the limit of the module's PrimeIndex are looked up in it, larger ones are
+    tested with is_probable_prime, which is deterministic below 2 ** 64.
+    :param n: an int
+    :return: boolean
+
+    >>> is_prime(7), is_prime(1), is_prime(7919 * 7927)
+    (True, False, False)
+
+    >>> is_prime(2 ** 61 - 1), is_prime(2 ** 61 + 1)
+    (True, False)
+    """
+    index = prime_index()
+    if n < index.limit:
+        return index.is_prime(n)
+    return is_probable_prime(n)
+
+
+def prime_count(n):
+    """
+    Return the number of primes not greater than the given int
+
+    :param n: an int
+    :return: an int
+
+    >>> prime_count(10), prime_count(10**6)
+    (4, 78498)
+    """
+    return prime_index().prime_count(n)
+
+
+def nth_prime(k):
+    """
+    Return the k-th prime number, counting from nth_prime(1) == 2
+
+    :param k: a positive int
+    :return: a prime number
+
+    >>> nth_prime(1), nth_prime(4), nth_prime(78498)
+    (2, 7, 999983)
+    """
+    return prime_index().nth_prime(k)
+
+
+def next_prime(n):
+    """
+    Return the smallest prime greater than the given int
+
+    :param n: an int
+    :return: a prime number
+
+    >>> next_prime(0), next_prime(7), next_prime(999983)
+    (2, 11, 1000003)
+    """
+    return prime_index().next_prime(n)
+
+
+def prev_prime(n):
+    """
+    Return the largest prime less than the given int
+
+    :param n: an int greater than 2
+    :return: a prime number
+
+    >>> prev_prime(3), prev_prime(7), prev_prime(1000000)
+    (2, 5, 999983)
+    """
+    return prime_index().prev_prime(n)
+
+
+# bases making Miller-Rabin test deterministic for all n < 3.3 * 10 ** 24, 2 ** 64 included
+_MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+# small primes from the sieve an int is checked against before any probable prime test
+_TRIAL_PRIMES = tuple(small_primes(1000))
+_TRIAL_PRODUCT = prod(_TRIAL_PRIMES)
+# ints below it with no trial prime factors are primes
+_TRIAL_LIMIT = 1009 ** 2
+
+
+def miller_rabin(n, bases=_MILLER_RABIN_BASES):
+    """
+    Return True if the given odd int is a strong probable prime to all the given bases, False otherwise
+
+    :param n: an odd int greater than 2
+    :param bases: an iterable of ints to test n with
+    :return: boolean
+
+    >>> miller_rabin(561), miller_rabin(2 ** 61 - 1)
+    (False, True)
+
+    # a strong pseudoprime to bases 2, 3, 5 and 7
+    >>> miller_rabin(3215031751, (2, 3, 5, 7)), miller_rabin(3215031751)
+    (True, False)
+    """
+    d, s = n - 1, 0
+    while not d & 1:
+        d >>= 1
+        s += 1
+    for a in bases:
+        a %= n
+        if not a:
+            continue
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _jacobi(a, n):
+    """
+    Return Jacobi symbol (a/n) for an odd positive n
+    """
+    a %= n
+    result = 1
+    while a:
+        while not a & 1:
+            a >>= 1
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def strong_lucas(n):
+    """
+    Return True if the given odd int is a strong Lucas probable prime with Selfridge's parameters, False otherwise
+
+    :param n: an odd int greater than 2
+    :return: boolean
+
+    >>> strong_lucas(2 ** 89 - 1), strong_lucas(561), strong_lucas(3215031751)
+    (True, False, False)
+    """
+    if isqrt(n) ** 2 == n:
+        return False
+    # first D in 5, -7, 9, -11, ... with Jacobi symbol (D/n) == -1
+    d = 5
+    while True:
+        j = _jacobi(d, n)
+        if j == -1:
+            break
+        if j == 0 and abs(d) != n:
+            return False
+        d = -d - 2 if d > 0 else -d + 2
+    p, q = 1, (1 - d) // 4
+
+    k, s = n + 1, 0
+    while not k & 1:
+        k >>= 1
+        s += 1
+    # U, V and Q ** i of the Lucas sequences for i growing bit by bit up to k
+    u, v, qi = 1, p, q % n
+    for bit in bin(k)[3:]:
+        u, v, qi = u * v % n, (v * v - 2 * qi) % n, qi * qi % n
+        if bit == '1':
+            u, v = p * u + v, d * u + p * v
+            # halving modulo odd n
+            u = (u + n if u & 1 else u) // 2 % n
+            v = (v + n if v & 1 else v) // 2 % n
+            qi = qi * q % n
+    if not u or not v:
+        return True
+    for _ in range(s - 1):
+        v, qi = (v * v - 2 * qi) % n, qi * qi % n
+        if not v:
+            return True
+    return False
+
+
+def is_probable_prime(n, rounds=0):
+    """
+    Return True if the given int is prime, False otherwise, without sieving up to it
+
+    Small prime factors from the sieve are ruled out first. The answer is exact for n < 2 ** 64
+    where Miller-Rabin test with known bases is deterministic. Larger ints are checked with
+    Baillie-PSW test, no counterexample to which is known, and optional rounds of Miller-Rabin
+    test with random bases on top of it.
+    :param n: an int
+    :param rounds: number of extra random-base Miller-Rabin rounds for n >= 2 ** 64
+    :return: boolean
+
+    >>> is_probable_prime(97), is_probable_prime(1009 ** 2), is_probable_prime(2 ** 64 - 59)
+    (True, False, True)
+
+    >>> is_probable_prime(2 ** 127 - 1, rounds=5), is_probable_prime((2 ** 61 - 1) * (2 ** 89 - 1))
+    (True, False)
+    """
+    if n < 2:
+        return False
+    if gcd(n, _TRIAL_PRODUCT) != 1:
+        return n in _TRIAL_PRIMES
+    if n < _TRIAL_LIMIT:
+        return True
+    if n < 1 << 64:
+        return miller_rabin(n)
+    if not miller_rabin(n, (2,)) or not strong_lucas(n):
+        return False
+    return miller_rabin(n, [random.randrange(2, n - 1) for _ in range(rounds)])
+
+
+def is_probable_prime_many(ns, rounds=0):
+    """
+    Return is_probable_prime for every int of the given iterable or NumPy array
+
+    Ints of an array are checked against small primes all at once, only the remaining ones are tested one by one.
+    :param ns: an iterable of ints or a NumPy array of ints
+    :param rounds: number of extra random-base Miller-Rabin rounds for ints >= 2 ** 64
+    :return: a list of booleans, or a boolean array for an array
+
+    >>> is_probable_prime_many([1, 2, 9, 2 ** 61 - 1])
+    [False, True, False, True]
+
+    >>> is_probable_prime_many(np.array([15, 17, 3215031751, 18446744073709551557], dtype=np.uint64)).tolist()
+    [False, True, False, True]
+    """
+    if np is None or not isinstance(ns, np.ndarray):
+        return [is_probable_prime(n, rounds) for n in ns]
+    result = np.zeros(ns.shape, dtype=bool)
+    unknown = ns >= 2
+    for p in _TRIAL_PRIMES:
+        divisible = ns % p == 0
+        result |= divisible & (ns == p)
+        unknown &= ~divisible
+    for i in np.flatnonzero(unknown):
+        result.flat[i] = is_probable_prime(int(ns.flat[i]), rounds)
+    return result
+
+
+# rules of multiplicative functions, returning values at prime powers pe = p ** e
+_MULTIPLICATIVE_RULES = {
+    'totient': lambda p, e, pe: pe - pe // p,
+    'mobius': lambda p, e, pe: np.where(e == 1, -1, 0),
+    'divisor_count': lambda p, e, pe: e + 1,
+    'divisor_sum': lambda p, e, pe: (pe * p - 1) // (p - 1),
+}
+
+
+def multiplicative_chunks(function, hi, *, lo=0, chunk_size=SEGMENT_SIZE * 8):
+    """
+    Return a generator of NumPy arrays with values of a multiplicative function f(n) for lo <= n < hi
+
+    Every chunk is filled in a single pass over the sieve's base primes up to the square root of hi:
+    their powers are divided out of the chunk's ints with vectorized slices, whatever is left
+    over is a single prime factor. Only a chunk is kept in memory at a time. f(0) is 0.
+    :param function: 'totient', 'mobius', 'divisor_count', 'divisor_sum', or a function of
+                     prime p, exponent e and p ** e taking and returning int64 arrays
+    :param hi: an int values are computed below
+    :param lo: an int values start from
+    :param chunk_size: number of ints per chunk
+    :return: a generator of int64 ndarrays
+
+    >>> [chunk.tolist() for chunk in multiplicative_chunks('divisor_count', 10, chunk_size=4)]
+    [[0, 1, 2, 2], [3, 2, 4, 2], [4, 3]]
+
+    # number of distinct prime factors isn't multiplicative, but 2 ** omega(n) is
+    >>> next(multiplicative_chunks(lambda p, e, pe: np.full_like(pe, 2), 13, lo=10)).tolist()
+    [4, 2, 4]
+    """
+    if np is None:
+        raise ImportError('multiplicative_chunks requires NumPy')
+    rule = _MULTIPLICATIVE_RULES.get(function, function)
+    base = small_primes(isqrt(max(hi - 1, 0)))
+    for start in range(lo, hi, chunk_size):
+        size = min(chunk_size, hi - start)
+        rest = np.arange(start, start + size, dtype=np.int64)
+        values = np.ones(size, dtype=np.int64)
+        # 0 is divisible by every power of a prime, it's set apart and fixed up below
+        if start == 0:
+            rest[0] = 1
+        for p in base:
+            i = -start % p
+            if i >= size:
+                continue
+            multiples = rest[i::p]
+            e, pe = np.zeros_like(multiples), np.ones_like(multiples)
+            divisible = multiples % p == 0
+            while divisible.any():
+                multiples = np.where(divisible, multiples // p, multiples)
+                e += divisible
+                pe = np.where(divisible, pe * p, pe)
+                divisible = multiples % p == 0
+            rest[i::p] = multiples
+            values[i::p] *= np.where(e > 0, rule(p, e, pe), 1)
+        large = rest > 1
+        values[large] *= rule(rest[large], np.ones_like(rest[large]), rest[large])
+        if start == 0:
+            values[0] = 0
+        yield values
+
+
+def multiplicative_table(function, hi, *, lo=0, chunk_size=SEGMENT_SIZE * 8):
+    """
+    Return a NumPy array with values of a multiplicative function f(n) for lo <= n < hi, see multiplicative_chunks
+
+    :param function: 'totient', 'mobius', 'divisor_count', 'divisor_sum', or a rule for prime powers
+    :param hi: an int values are computed below
+    :param lo: an int values start from
+    :param chunk_size: number of ints filled at a time
+    :return: an int64 ndarray
+
+    >>> multiplicative_table('totient', 10).tolist()
+    [0, 1, 1, 2, 2, 4, 2, 6, 4, 6]
+    >>> multiplicative_table('mobius', 10).tolist()
+    [0, 1, -1, -1, 0, -1, 1, -1, 0, 0]
+    >>> multiplicative_table('divisor_sum', 10).tolist()
+    [0, 1, 3, 4, 7, 6, 12, 8, 15, 13]
+    """
+    chunks = list(multiplicative_chunks(function, hi, lo=lo, chunk_size=chunk_size))
+    if not chunks:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def totient_table(hi, *, lo=0):
+    """
+    Return a NumPy array of Euler's totient phi(n) for lo <= n < hi
+
+    >>> totient_table(13, lo=10).tolist()
+    [4, 10, 4]
+    """
+    return multiplicative_table('totient', hi, lo=lo)
+
+
+def mobius_table(hi, *, lo=0):
+    """
+    Return a NumPy int8 array of Mobius function mu(n) for lo <= n < hi
+
+    >>> mobius_table(13, lo=10).tolist()
+    [1, -1, 0]
+    """
+    return multiplicative_table('mobius', hi, lo=lo).astype(np.int8)
+
+
+def divisor_count_table(hi, *, lo=0):
+    """
+    Return a NumPy int32 array of the number of divisors d(n) for lo <= n < hi
+
+    >>> divisor_count_table(13, lo=10).tolist()
+    [4, 2, 6]
+    """
+    return multiplicative_table('divisor_count', hi, lo=lo).astype(np.int32)
+
+
+def divisor_sum_table(hi, *, lo=0):
+    """
+    Return a NumPy array of the sum of divisors sigma(n) for lo <= n < hi
+
+    >>> divisor_sum_table(13, lo=10).tolist()
+    [18, 12, 28]
+    """
+    return multiplicative_table('divisor_sum', hi, lo=lo)
+
+
+def _pollard_brent(n):
+    """
+    Return a nontrivial factor of the given odd composite int with Brent's variant of Pollard's rho algorithm
+    """
+    while True:
+        y, c, m = random.randrange(1, n), random.randrange(1, n), 128
+        g = r = q = 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += m
+            r *= 2
+        # the product of differences got a multiple of n, go back one difference at a time
+        if g == n:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+        if g != n:
+            return g
+
+
+def _factorize(n):
+    """
+    Return a tuple of ascending prime factors of the given positive int
+    """
+    factors = []
+    small = gcd(n, _TRIAL_PRODUCT)
+    for p in _TRIAL_PRIMES:
+        if p > small:
+            break
+        while not n % p:
+            factors.append(p)
+            n //= p
+    rest = [n] if n > 1 else []
+    while rest:
+        m = rest.pop()
+        # with no trial prime factors left, ints below _TRIAL_LIMIT are primes
+        if m < _TRIAL_LIMIT or is_probable_prime(m):
+            factors.append(m)
+        else:
+            d = _pollard_brent(m)
+            rest += [d, m // d]
+    factors.sort()
+    return tuple(factors)
+
+
+_factorize_cached = lru_cache(maxsize=FACTOR_CACHE_SIZE)(_factorize)
+
+
+def factorize(n, cache=True):
+    """
+    Return a list of ascending prime factors of the given int, repeated according to their multiplicity
+
+    Small prime factors from the sieve are divided out first, what remains is split with
+    Pollard-Brent rho algorithm until is_probable_prime holds for every factor.
+    :param n: a positive int
+    :param cache: if True, factorizations are kept in an LRU cache of FACTOR_CACHE_SIZE entries
+    :return: a list of prime numbers
+
+    >>> factorize(1), factorize(360), factorize(97)
+    ([], [2, 2, 2, 3, 3, 5], [97])
+
+    >>> factorize(600851475143)
+    [71, 839, 1471, 6857]
+
+    >>> factorize(2 ** 64 + 1)
+    [274177, 67280421310721]
+    """
+    if n < 1:
+        raise ValueError('n must be positive, got {}'.format(n))
+    return list(_factorize_cached(n) if cache else _factorize(n))
+
+
+def factorize_many(ns, workers=None, cache=True, chunk_size=256):
+    """
+    Return a generator of factorize results for every int of the given iterable, in the same order
+
+    :param ns: an iterable of positive ints
+    :param workers: number of worker processes to spread chunks of ints over, factorized in this process if None
+    :param cache: if True, factorizations are kept in an LRU cache of every process
+    :param chunk_size: number of ints handed to a worker process at a time
+    :return: a generator of lists of prime numbers
+
+    >>> list(factorize_many([12, 97, 1]))
+    [[2, 2, 3], [97], []]
+
+    >>> list(factorize_many([360, 2 ** 64 + 1, 97], workers=2, chunk_size=1))
+    [[2, 2, 2, 3, 3, 5], [274177, 67280421310721], [97]]
+    """
+    if workers is None:
+        for n in ns:
+            yield factorize(n, cache)
+        return
+
+    ns = iter(ns)
+    chunks = iter(lambda: list(islice(ns, chunk_size)), [])
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_factorize_chunk, chunk, cache))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _factorize_chunk(ns, cache):
+    return [factorize(n, cache) for n in ns]
+
+
+def spf_table(n):
+    """
+    Return an array('I') of the smallest prime factor of every int below n, 0 and 1 stand for themselves
+
+    Multiples of every prime up to the square root of n are struck out with slice assignments
+    in descending order of primes, so that the smallest prime is the one left for every composite.
+    :param n: an int the table covers ints below, at most 2 ** 32
+    :return: an array('I') of ints
+
+    >>> list(spf_table(16))
+    [0, 1, 2, 3, 2, 5, 2, 7, 2, 3, 2, 11, 2, 13, 2, 3]
+    """
+    spf = array('I', range(n))
+    for p in reversed(small_primes(isqrt(max(n - 1, 0)))):
+        spf[p * p::p] = array('I', [p]) * len(range(p * p, n, p))
+    return spf
+
+
+def factor_with_spf(n, spf):
+    """
+    Return a generator of ascending prime factors of the given int, repeated according to their multiplicity
+
+    Every factor is a single lookup in a table of smallest prime factors.
+    :param n: a positive int less than len(spf)
+    :param spf: a table made by spf_table
+    :return: a generator of prime numbers
+
+    >>> list(factor_with_spf(360, spf_table(1000)))
+    [2, 2, 2, 3, 3, 5]
+    """
+    while n > 1:
+        p = spf[n]
+        yield p
+        n //= p
+
+
+def factor_many_with_spf(ns, spf):
+    """
+    Return factorizations of every int of the given iterable or NumPy array with a table of smallest prime factors
+
+    An array is factored all at once, one smallest prime factor of every int per step.
+    :param ns: an iterable of positive ints or a NumPy array of them, all less than len(spf)
+    :param spf: a table made by spf_table
+    :return: a list of lists of prime numbers, or for an array a 2-D array with a row of
+             ascending prime factors per int padded with 1s
+
+    >>> spf = spf_table(1000)
+    >>> factor_many_with_spf([1, 12, 997], spf)
+    [[], [2, 2, 3], [997]]
+    >>> factor_many_with_spf(np.array([1, 12, 997]), spf).tolist()
+    [[1, 1, 1], [2, 2, 3], [997, 1, 1]]
+    """
+    if np is None or not isinstance(ns, np.ndarray):
+        return [list(factor_with_spf(n, spf)) for n in ns]
+    table = np.frombuffer(spf, dtype=np.uint32)
+    rest = ns.astype(np.int64)
+    columns = []
+    while True:
+        p = np.where(rest > 1, table[rest], 1).astype(np.int64)
+        if not (p > 1).any():
+            break
+        columns.append(p)
+        rest //= p
+    if not columns:
+        return np.ones((len(ns), 0), dtype=np.int64)
+    return np.stack(columns, axis=1)
+
+
+@lru_cache(maxsize=None)
+def lehmer_prime_count(x):
+    """
+    Return the number of primes not greater than the given int without enumerating them
+
+    Lehmer's formula takes about O(x ** (2 / 3)) time: pi of ints up to x ** (2 / 3), but no
+    more than PI_TABLE_LIMIT, is looked up in the module's PrimeIndex, larger ones are counted
+    recursively. Results and phi(x, a) sub-results are memoized.
+    :param x: an int
+    :return: an int
+
+    >>> lehmer_prime_count(10 ** 6) == prime_count(10 ** 6)
+    True
+
+    >>> lehmer_prime_count(10 ** 10)
+    455052511
+    """
+    index = prime_index()
+    if x < index.limit:
+        return index.prime_count(x)
+    index.extend(min(max(int(x ** (2 / 3)), 1 << 16), PI_TABLE_LIMIT))
+    if x < index.limit:
+        return index.prime_count(x)
+
+    a = _prime_count_small(_iroot(x, 4))
+    b = _prime_count_small(isqrt(x))
+    c = _prime_count_small(_iroot(x, 3))
+    primes = _phi_primes(b)
+    result = _phi(x, a) + (b + a - 2) * (b - a + 1) // 2
+    count, limit = index.prime_count, index.limit
+    for i in range(a + 1, b + 1):
+        w = x // primes[i - 1]
+        result -= count(w) if w < limit else lehmer_prime_count(w)
+        if i <= c:
+            for j in range(i, count(isqrt(w)) + 1):
+                y = w // primes[j - 1]
+                result -= (count(y) if y < limit else lehmer_prime_count(y)) - j + 1
+    return result
+
+
+def _iroot(x, k):
+    """
+    Return the largest int r such that r ** k <= x
+    """
+    r = int(round(x ** (1 / k)))
+    while r ** k > x:
+        r -= 1
+    while (r + 1) ** k <= x:
+        r += 1
+    return r
+
+
+def _prime_count_small(n):
+    return prime_index().prime_count(n)
+
+
+# primes phi(x, a) strikes out the multiples of, grown on demand
+_PHI_PRIMES = []
+
+
+def _phi_primes(a):
+    """
+    Return a list of at least a first primes
+    """
+    global _PHI_PRIMES
+    if len(_PHI_PRIMES) < a:
+        _PHI_PRIMES = small_primes(_nth_prime_bound(a))
+    return _PHI_PRIMES
+
+
+@lru_cache(maxsize=None)
+def _phi_wheel(a):
+    """
+    Return (m, totient of m, counts) for the product m of first a primes, counts[r] being phi(r, a) for r < m
+    """
+    m = prod(_phi_primes(a)[:a])
+    counts = array('Q', [0]) * m
+    total = 0
+    for r in range(1, m):
+        total += gcd(r, m) == 1
+        counts[r] = total
+    return m, total, counts
+
+
+@lru_cache(maxsize=PHI_CACHE_SIZE)
+def _phi(x, a):
+    """
+    Return the number of positive ints not greater than x not divisible by any of first a primes
+    """
+    if not a:
+        return x
+    if a <= 5:
+        m, totient, counts = _phi_wheel(a)
+        return x // m * totient + counts[x % m]
+    p = _PHI_PRIMES[a - 1]
+    if x <= p:
+        return min(x, 1)
+    index = _prime_index
+    # the only ints left are 1 and primes greater than p
+    if p * p >= x and x < index.limit:
+        return index.prime_count(x) - a + 1
+    return _phi(x, a - 1) - _phi(x // p, a - 1)
+
+
+def prime_aggregate(x, weight, prefix):
+    """
+    Return the sum of weight(p) over all primes p not greater than x without enumerating them
+
+    Lucy_Hedgehog's dynamic programming over the O(sqrt(x)) distinct values of x // k strikes
+    composites out of the weight's prefix sums one sieved prime at a time in O(x ** (3 / 4)) steps.
+    :param x: an int
+    :param weight: a completely multiplicative function of an int, e.g. lambda n: n
+    :param prefix: a function returning the sum of weight(n) for 1 <= n <= v, e.g. lambda v: v * (v + 1) // 2
+    :return: the sum of weights of primes
+
+    >>> prime_aggregate(100, lambda n: 1, lambda v: v)
+    25
+
+    # primes 1 mod 4 counted with a Dirichlet character mod 4
+    >>> chi = prime_aggregate(100, lambda n: (0, 1, 0, -1)[n % 4], lambda v: (0, 1, 1, 0)[v % 4])
+    >>> (prime_count(100) - 1 + chi) // 2
+    11
+    """
+    if x < 2:
+        return 0
+    r = isqrt(x)
+    # sums over 2 <= n <= v of weights of primes and of ints with no prime factors sieved so far,
+    # small[v] for v <= r and large[k] for v = x // k
+    small = [0] + [prefix(v) - 1 for v in range(1, r + 1)]
+    large = [0] + [prefix(x // k) - 1 for k in range(1, r + 1)]
+    for p in small_primes(r):
+        wp, sp, square = weight(p), small[p - 1], p * p
+        for k in range(1, min(r, x // square) + 1):
+            kp = k * p
+            large[k] -= wp * ((large[kp] if kp <= r else small[x // kp]) - sp)
+        for v in range(r, square - 1, -1):
+            small[v] -= wp * (small[v // p] - sp)
+    return large[1]
+
+
+def prime_sum(x, k=1):
+    """
+    Return the sum of p ** k over all primes p not greater than x, see prime_aggregate
+
+    :param x: an int
+    :param k: a non-negative int power, 0 for counting primes
+    :return: an int
+
+    >>> prime_sum(10), prime_sum(10, 0), prime_sum(10, 2)
+    (17, 4, 87)
+
+    >>> prime_sum(10 ** 6) == sum(segmented_sieve(hi=10 ** 6 + 1))
+    True
+    """
+    return prime_aggregate(x, lambda n: n ** k, lambda v: _power_sum(v, k))
+
+
+@lru_cache(maxsize=None)
+def _bernoulli(k):
+    """
+    Return a tuple of Bernoulli numbers B0 to Bk, with B1 = +1/2
+    """
+    b = []
+    for m in range(k + 1):
+        b.append(1 - sum(comb(m, j) * b[j] / Fraction(m - j + 1) for j in range(m)))
+    return tuple(b)
+
+
+def _power_sum(v, k):
+    """
+    Return 1 ** k + 2 ** k + ... + v ** k by Faulhaber's formula
+    """
+    b = _bernoulli(k)
+    return int(sum(comb(k + 1, j) * b[j] * v ** (k + 1 - j) for j in range(k + 1)) / (k + 1))
+
+
+def fib():
+    """
+    Return a generator of Fibonacci sequence
+    :return: a generator of Fibinacci numbers
+
+    >>> list(take(lambda x: x < 100, fib()))
+    [0, 1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89]
+
+    >>> F = fib()
+    >>> F.send(None), F.send(100)
+    (0, 354224848179261915075)
+    >>> next(F)
+    573147844013817084101
+    """
+    a, b = 0, 1
+    while True:
+        val = (yield a)
+        # if .send() method invoked, jump to the val-th number
+        if val is not None:
+            a, b = _fib_pair(val)
+        # if .__next__() method invoked
+        else:
+            a, b = b, (a + b)
+
+
+def _fib_pair(n, m=None):
+    """
+    Return (F(n), F(n + 1)) by fast doubling, modulo m if given
+    """
+    if n < 0:
+        raise ValueError('n must be non-negative, got {}'.format(n))
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        # F(2k) = F(k) * (2 * F(k + 1) - F(k)), F(2k + 1) = F(k) ** 2 + F(k + 1) ** 2
+        a, b = a * (2 * b - a), a * a + b * b
+        if m is not None:
+            a, b = a % m, b % m
+        if bit == '1':
+            a, b = b, a + b
+            if m is not None:
+                b %= m
+    return a, b
+
+
+def fib_nth(n):
+    """
+    Return the n-th Fibonacci number in O(log n) multiplications with fast doubling
+
+    :param n: a non-negative int
+    :return: an int
+
+    >>> fib_nth(0), fib_nth(10), fib_nth(100)
+    (0, 55, 354224848179261915075)
+
+    >>> fib_nth(10 ** 6).bit_length()
+    694241
+    """
+    return _fib_pair(n)[0]
+
+
+def fib_mod(n, m):
+    """
+    Return the n-th Fibonacci number modulo m without computing the number itself
+
+    :param n: a non-negative int
+    :param m: a positive int
+    :return: an int
+
+    >>> fib_mod(100, 10 ** 9 + 7), fib_mod(10 ** 18, 10 ** 9 + 7)
+    (687995182, 209783453)
+    """
+    return _fib_pair(n, m)[0] % m
+
+
+def pisano_period(m):
+    """
+    Return the period of Fibonacci sequence modulo m
+
+    A period is known for every prime power dividing m, the least common multiple of them is
+    reduced by each of its prime factors for as long as it stays a period.
+    :param m: a positive int
+    :return: an int
+
+    >>> pisano_period(1), pisano_period(2), pisano_period(10), pisano_period(10 ** 9 + 7)
+    (1, 3, 60, 2000000016)
+    """
+    if m < 1:
+        raise ValueError('m must be positive, got {}'.format(m))
+    factors = factorize(m)
+    period = 1
+    for p in set(factors):
+        k = factors.count(p)
+        if p == 2:
+            bound = 3
+        elif p == 5:
+            bound = 20
+        elif p % 5 in (1, 4):
+            bound = p - 1
+        else:
+            bound = 2 * (p + 1)
+        period = period * p ** (k - 1) * bound // gcd(period, p ** (k - 1) * bound)
+    for q in set(factorize(period)):
+        while not period % q and _fib_pair(period // q, m) == (0, 1 % m):
+            period //= q
+    return period
+
+
+def fib_mod_many(ns, ms):
+    """
+    Return fib_mod for every pair of ints of the given iterables or NumPy arrays
+
+    Arrays are evaluated all at once, bit by bit of the largest n, if every modulus is below 2 ** 32.
+    :param ns: an iterable of non-negative ints or a NumPy array of them
+    :param ms: an iterable of positive ints, a NumPy array of them, or a single int for every n
+    :return: a list of ints, or an int64 array for arrays
+
+    >>> fib_mod_many([10, 100, 1000], 1000)
+    [55, 75, 875]
+
+    >>> fib_mod_many(np.array([10, 100, 1000]), np.array([7, 1000, 10 ** 9 + 7])).tolist()
+    [6, 75, 517691607]
+    """
+    arrays = np is not None and (isinstance(ns, np.ndarray) or isinstance(ms, np.ndarray))
+    if not arrays:
+        if isinstance(ms, int):
+            return [fib_mod(n, ms) for n in ns]
+        return [fib_mod(n, m) for n, m in zip(ns, ms)]
+    ns, ms = np.broadcast_arrays(np.asarray(ns, dtype=np.uint64), np.asarray(ms, dtype=np.uint64))
+    if ms.size and int(ms.max()) >= 1 << 32:
+        return np.array([fib_mod(int(n), int(m)) for n, m in np.nditer((ns, ms))], dtype=np.int64)
+    # the same as _fib_pair, products of two residues below 2 ** 32 fit in uint64
+    a, b = np.zeros(ns.shape, dtype=np.uint64), np.ones(ns.shape, dtype=np.uint64) % ms
+    for shift in reversed(range(int(ns.max()).bit_length() if ns.size else 0)):
+        a, b = a * ((2 * b + ms - a) % ms) % ms, (a * a % ms + b * b % ms) % ms
+        bit = (ns >> np.uint64(shift)) & np.uint64(1) == 1
+        a, b = np.where(bit, b, a), np.where(bit, (a + b) % ms, b)
+    return a.astype(np.int64)